@@ -1,8 +1,13 @@
 import scraper_classes as SC
 import scraper_exceptions as SE
+import scraper_logging as SL
 from pathlib import Path
+import logging
+import sys
 
 if __name__ == '__main__':
+    # progress is logged at INFO level, print it to the console from the logging thread
+    SL.add_console_handler(logging.INFO, sys.stdout)
 
     scraper = SC.GoogleScraper(
         keyword='Airline Stocks', 
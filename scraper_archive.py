@@ -0,0 +1,275 @@
+"""Compressed, content-addressed archive of the raw HTML of every scraped article, and offline re-extraction from it.
+
+Usage:
+    python scraper_archive.py reextract /data/archive /data/reextracted --max-text-word-count 1000
+    python scraper_archive.py stats /data/archive
+
+Scrape with GoogleScraper(..., html_archive='/data/archive') to fill the archive. Re-extraction rebuilds the
+per-period article files of every archived search from the stored HTML with the current extraction code and
+word limits, in parallel over all cores and without any network access.
+"""
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import scraper_exceptions as SE
+import scraper_fetching as SF
+import scraper_logging as SL
+import scraper_postprocessing as SPost
+import scraper_sinks as SSinks
+from scraper_cache import normalize_url
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+
+class HTMLArchive:
+    """Archive of raw article HTML, stored gzip compressed under its SHA-256.
+
+    Identical pages (the same article found under several URLs or in several runs) are stored once.
+    A SQLite index maps every normalized URL to the latest content fetched for it, and records the
+    search results (keyword, period, date, link) the articles were found in, which re-extraction
+    rebuilds the datasets from.
+
+    Args:
+        path (str): Directory of the archive.
+        compression_level (int): gzip compression level, 1 (fastest) to 9 (smallest).
+    """
+    def __init__(self, path, compression_level=6):
+        self.path = Path(path)
+        self.compression_level = compression_level
+        (self.path / 'objects').mkdir(parents=True, exist_ok=True)
+        self.stored = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path / 'index.db'), timeout=30, check_same_thread=False)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                        url TEXT PRIMARY KEY,
+                                        link TEXT NOT NULL,
+                                        sha256 TEXT NOT NULL,
+                                        source TEXT NOT NULL,
+                                        fetched_at REAL NOT NULL)""")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                        keyword TEXT NOT NULL,
+                                        from_d TEXT NOT NULL,
+                                        to_d TEXT NOT NULL,
+                                        date TEXT,
+                                        url TEXT NOT NULL,
+                                        link TEXT NOT NULL,
+                                        PRIMARY KEY (keyword, from_d, to_d, url))""")
+        self._connection.commit()
+
+    def object_path(self, sha256):
+        # two levels of fan-out keep directories small
+        return self.path / 'objects' / sha256[:2] / sha256[2:4] / f'{sha256}.html.gz'
+
+    @SE.ExceptionHandler(SE.ArchiveException, raise_error=False)
+    def store(self, link, html, source):
+        """Store the HTML of a link. The index entry is written with the next commit.
+
+        Args:
+            link (str): URL the HTML was fetched from.
+            html (str): Raw HTML (or the DOM serialized by the browser).
+            source (str): 'http' or 'browser'.
+
+        Returns:
+            str: SHA-256 of the HTML.
+        """
+        data = html.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.object_path(sha256)
+        if path.exists():
+            self.deduplicated += 1
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            temp_path.write_bytes(gzip.compress(data, self.compression_level))
+            temp_path.replace(path)
+            self.stored += 1
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO pages (url, link, sha256, source, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                                     (normalize_url(link), link, sha256, source, time.time()))
+        return sha256
+
+    @SE.ExceptionHandler(SE.ArchiveException, raise_error=False)
+    def record_results(self, keyword, from_d, to_d, dates_links):
+        """Record the search results of a results page and commit the index.
+
+        Args:
+            keyword (str): Searched keyword.
+            from_d (str): (format MM/DD/YYYY) Start of period.
+            to_d (str): (format MM/DD/YYYY) End of period.
+            dates_links (list[tuple]): (date, link) of every result.
+        """
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO results (keyword, from_d, to_d, date, url, link) VALUES (?, ?, ?, ?, ?, ?)",
+                                         [(keyword, from_d, to_d, date, normalize_url(link), link) for date, link in dates_links])
+            self._connection.commit()
+
+    def contains(self, link):
+        """Return whether the HTML of a link is archived."""
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM pages WHERE url = ?", (normalize_url(link),)).fetchone() is not None
+
+    def load(self, link):
+        """Return the archived HTML of a link, or None if it is not archived."""
+        with self._lock:
+            row = self._connection.execute("SELECT sha256 FROM pages WHERE url = ?", (normalize_url(link),)).fetchone()
+        return read_object(self.object_path(row[0])) if row is not None else None
+
+    def searches(self, keyword=None):
+        """Return {(keyword, from_d, to_d): [(date, link, object path or None), ...]} of the recorded search results."""
+        query = ("SELECT r.keyword, r.from_d, r.to_d, r.date, r.link, p.sha256 FROM results r LEFT JOIN pages p ON p.url = r.url"
+                 + (" WHERE r.keyword = ?" if keyword is not None else "") + " ORDER BY r.rowid")
+        with self._lock:
+            rows = self._connection.execute(query, (keyword,) if keyword is not None else ()).fetchall()
+        searches = {}
+        for keyword, from_d, to_d, date, link, sha256 in rows:
+            path = str(self.object_path(sha256)) if sha256 is not None else None
+            searches.setdefault((keyword, from_d, to_d), []).append((date, link, path))
+        return searches
+
+    def stats(self, disk_usage=True):
+        """Index counts and the pages stored by this process. disk_usage adds the size of all objects, which walks the archive."""
+        with self._lock:
+            pages = self._connection.execute("SELECT COUNT(*), COUNT(DISTINCT sha256) FROM pages").fetchone()
+            results = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        stats = {'urls': pages[0],
+                 'objects': pages[1],
+                 'results': results,
+                 'stored': self.stored,
+                 'deduplicated': self.deduplicated,
+                 }
+        if disk_usage:
+            size = sum(path.stat().st_size for path in (self.path / 'objects').rglob('*.html.gz'))
+            stats['compressed_mb'] = round(size / 1024**2, 3)
+        return stats
+
+    @SE.ExceptionHandler(SE.ArchiveException, raise_error=False)
+    def commit(self):
+        """Commit the index entries of the pages stored since the last record_results."""
+        with self._lock:
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+
+
+def read_object(path):
+    with gzip.open(path, 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def _extract_object(path):
+    """Extract (title, headers, text) of an archived page, runs in the worker processes of reextract."""
+    if path is None:
+        return None
+    try: html = read_object(path)
+    except OSError: return None
+    article = SF.FetchedArticle.from_html('', html)
+    return article.title, article.headers, article.text
+
+
+def reextract(archive, output_dir, max_header_word_count=20, max_text_word_count=400, sink_format='csv', workers=None, keyword=None):
+    """Rebuild the per-period article files of the archived searches from the stored HTML.
+
+    Pages are parsed with ArticleHTMLParser in a pool of worker processes, which get the pages of all searches
+    as one stream so they do not idle between searches. Word limits are applied per period with SPost.process_batch
+    and the articles are written with the sink of sink_format.
+
+    Args:
+        archive (HTMLArchive): Archive to re-extract.
+        output_dir (str): Directory the article files are written to.
+        max_header_word_count (int): Number of words headers are truncated to.
+        max_text_word_count (int): Number of words text is truncated to.
+        sink_format (str): Output format, a key of scraper_sinks.SINKS.
+        workers (int): Number of worker processes, defaults to the number of cores.
+        keyword (str): Only re-extract the searches of this keyword.
+
+    Returns:
+        dict: Number of periods and articles written, of results whose page was never archived
+            ('not_archived') and of results whose archived page cannot be read ('missing').
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    searches = archive.searches(keyword)
+    sink = SSinks.SINKS[sink_format](output_dir)
+    report = {'periods': 0, 'articles': 0, 'not_archived': 0, 'missing': 0}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            paths = [path for results in searches.values() for _, _, path in results]
+            # results come back in the order of paths, each search takes its own from the stream
+            extracted = executor.map(_extract_object, paths, chunksize=max(len(paths) // (16 * (workers or os.cpu_count() or 1)), 1))
+            for (search_keyword, from_d, to_d), results in searches.items():
+                raw_articles = []
+                for (date, link, path), fields in zip(results, itertools.islice(extracted, len(results))):
+                    if fields is None:
+                        report['not_archived' if path is None else 'missing'] += 1
+                        continue
+                    raw_articles.append((*fields, date, link))
+                for article in SPost.process_batch(raw_articles, max_header_word_count, max_text_word_count):
+                    sink.write(article, search_keyword, from_d, to_d)
+                sink.close_period(search_keyword, from_d, to_d)
+                report['periods'] += 1
+                report['articles'] += len(raw_articles)
+                LOGGER.info(f'[{search_keyword}] {from_d} to {to_d}: {len(raw_articles)} articles')
+    finally:
+        sink.close()
+    if report['not_archived'] or report['missing']:
+        LOGGER.warning(f"Results left out: {report['not_archived']} never archived, {report['missing']} with an unreadable page")
+    return report
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    reextract_parser = commands.add_parser('reextract', help='Rebuild the article files from the archived HTML')
+    reextract_parser.add_argument('archive')
+    reextract_parser.add_argument('output_dir')
+    reextract_parser.add_argument('--max-header-word-count', type=int, default=20)
+    reextract_parser.add_argument('--max-text-word-count', type=int, default=400)
+    reextract_parser.add_argument('--format', choices=sorted(SSinks.SINKS), default='csv')
+    reextract_parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to the number of cores')
+    reextract_parser.add_argument('--keyword', default=None)
+
+    stats_parser = commands.add_parser('stats', help='Print the size of the archive')
+    stats_parser.add_argument('archive')
+    args = parser.parse_args(argv)
+
+    SL.add_console_handler(logging.INFO, sys.stdout)
+
+    archive = HTMLArchive(args.archive)
+    try:
+        if args.command == 'reextract':
+            report = reextract(archive, args.output_dir,
+                               max_header_word_count=args.max_header_word_count,
+                               max_text_word_count=args.max_text_word_count,
+                               sink_format=args.format,
+                               workers=args.workers,
+                               keyword=args.keyword)
+        else:
+            report = archive.stats()
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    finally:
+        archive.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Run many keyword searches over a shared set of browser and HTTP workers.
+
+Job file (JSON list or one JSON object per line):
+
+    {"keywords": ["Airline Stocks", "Cruise Stocks"], "search_start_date": "06/01/2019", "periods": 10, "periodicity": "2D", "google_results_pages": 2}
+
+Every object is one job per keyword ('keyword' or 'keywords'); any other GoogleScraper argument can be given per job,
+except the ones that apply to the whole run (RUNNER_ARGUMENTS: browser, output and metrics settings).
+"""
+import argparse
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+from pathlib import Path
+
+import scraper_classes as SC
+import scraper_exceptions as SE
+import scraper_fetching as SF
+import scraper_logging as SL
+import scraper_metrics as SM
+import scraper_pool as SP
+import scraper_session as SSession
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+# arguments that belong to the batch runner, not to the scrapers of a job
+RUNNER_ARGUMENTS = ('headless', 'session', 'sinks', 'article_fetcher', 'driver_path', 'offline_driver', 'browser_profile', 'metrics_file', 'metrics_interval')
+
+
+
+def load_job_specs(path):
+    """Read job specs from a JSON file holding a list of objects, or from a JSON lines file."""
+    text = Path(path).read_text(encoding='utf-8').strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _slug(keyword):
+    return re.sub(r'[^A-Za-z0-9]+', '_', keyword).strip('_') or 'keyword'
+
+
+def job_scraper_kwargs(job_id, job_kwargs, common_kwargs=None):
+    """GoogleScraper arguments of a job, its own arguments overriding common_kwargs.
+
+    Arguments of the runner (RUNNER_ARGUMENTS) are left out, the runner's values apply to all jobs.
+    A job setting one of them is warned about.
+    """
+    ignored = sorted(set(job_kwargs) & set(RUNNER_ARGUMENTS))
+    if ignored:
+        LOGGER.warning(f"Job {job_id} ({job_kwargs.get('keyword')}) sets {', '.join(ignored)}, "
+                       f"which only the runner sets, the runner's values apply")
+    return {key: value for key, value in dict(common_kwargs or {}, **job_kwargs).items() if key not in RUNNER_ARGUMENTS}
+
+
+def expand_job_specs(specs, output_dir):
+    """Expand specs with several keywords into one spec per keyword.
+
+    Jobs without a save_to_location write to a folder named after their keyword in output_dir.
+    """
+    jobs = []
+    for spec in specs:
+        spec = dict(spec)
+        keywords = spec.pop('keywords', None) or [spec.pop('keyword')]
+        spec.pop('keyword', None)
+        for keyword in keywords:
+            job_kwargs = dict(spec, keyword=keyword)
+            job_kwargs.setdefault('save_to_location', Path(output_dir) / _slug(keyword))
+            jobs.append(job_kwargs)
+    return jobs
+
+
+
+class BatchJob(SP.SearchProgress):
+    """Progress and output of one keyword search of a batch.
+
+    Args:
+        job_id (int): Number of the job in the batch.
+        scraper_kwargs (dict): Arguments the job's GoogleScrapers are created with.
+    """
+    def progress(self):
+        return {'job': self.job_id,
+                'keyword': self.keyword,
+                'pages_done': self.pages_done,
+                'pages_total': self.pages_total,
+                'articles': self.articles,
+                'periods_left': len(self.pending),
+                }
+
+
+
+class BatchRunner:
+    """Scrape a batch of jobs (keyword x date range x periodicity) with shared workers.
+
+    All jobs are expanded into (job, period, page) units that a scraper_pool.FairScheduler hands out round-robin over
+    the jobs. Every worker thread keeps one warm browser session, shared by the GoogleScrapers it creates
+    for the jobs it works on, and all scrapers fetch articles through one ArticleFetcher. Every job has its own
+    output folder, sinks and journal, so resume=True in a job's spec continues it after an interruption.
+
+    Args:
+        jobs (list[dict]): GoogleScraper arguments of every job, see expand_job_specs.
+        workers (int): Number of browser workers.
+        max_attempts (int): How many times a unit is tried before it is given up as empty.
+        max_browser_starts (int): How many browser starts in a row may fail before a worker stops.
+        headless (bool): Run Chrome without a window.
+        max_concurrent_fetches (int): Article requests in flight at the same time, over all jobs.
+        metrics_file (str): Metrics snapshots are written to this file during the run.
+        metrics_interval (float): Seconds between metrics snapshots.
+        **common_kwargs: Arguments passed to the GoogleScrapers of every job, job specs override them.
+    """
+    def __init__(self, jobs, workers=2, max_attempts=3, max_browser_starts=3, headless=True, max_concurrent_fetches=8,
+                 metrics_file=None, metrics_interval=30, **common_kwargs):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_browser_starts = max_browser_starts
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.jobs = [BatchJob(job_id, job_scraper_kwargs(job_id, job_kwargs, common_kwargs))
+                     for job_id, job_kwargs in enumerate(jobs, start=1)]
+        self.sessions = SSession.SessionManager(size=workers,
+                                                headless=headless,
+                                                driver_path=common_kwargs.get('driver_path'),
+                                                offline_driver=common_kwargs.get('offline_driver'),
+                                                browser_profile=common_kwargs.get('browser_profile', 'default'))
+        self.article_fetcher = None
+        self._units = SP.LocalUnitQueue(max_attempts)
+        self._stop = threading.Event()
+
+
+    def _acquire_session(self):
+        for _ in range(self.max_browser_starts):
+            try:
+                return self.sessions.acquire()
+            except Exception:
+                LOGGER.debug(f'{threading.current_thread().name} failed to start a browser')
+        return None
+
+
+    def _scraper_for(self, job, session, scrapers):
+        scraper = scrapers.get(job)
+        if scraper is None:
+            scraper = SC.GoogleScraper(**job.scraper_kwargs,
+                                       session=session,
+                                       sinks=job.sinks,
+                                       article_fetcher=self.article_fetcher)
+            # links journaled before an interruption are skipped
+            scraper.journal = job.journal
+            scrapers[job] = scraper
+        return scraper
+
+
+    @staticmethod
+    def _close_scrapers(scrapers):
+        for scraper in scrapers.values():
+            scraper.close()
+        scrapers.clear()
+
+
+    @staticmethod
+    def _close_done_scrapers(scrapers):
+        """Close the scrapers of the jobs that are done, with a long job file a worker would otherwise keep
+        the cache, archive and tabs of every job it ever worked on open."""
+        for job in [job for job in scrapers if job.done]:
+            scrapers.pop(job).close()
+
+
+    def _worker(self):
+        session = None
+        # {job: scraper} of the jobs this worker scraped units of
+        scrapers = {}
+        while not self._stop.is_set():
+            self._close_done_scrapers(scrapers)
+            try: job, unit = self._units.get(timeout=0.5)
+            except queue.Empty: continue
+
+            if session is None:
+                session = self._acquire_session()
+                if session is None:
+                    self._units.requeue(job, unit, count_attempt=False)
+                    break
+
+            scraper = self._scraper_for(job, session, scrapers)
+            if not SP.run_unit(self._units, job, unit, scraper, session.alive):
+                self._close_scrapers(scrapers)
+                self.sessions.release(session)
+                session = None
+
+        self._close_scrapers(scrapers)
+        if session is not None:
+            self.sessions.release(session)
+
+
+    def _record(self, job, unit, articles):
+        job.record(unit, articles)
+        if job.done:
+            LOGGER.info(f'[{job.keyword}] job {job.job_id} done: {job.articles} articles')
+            job.close()
+
+
+    def run(self):
+        """Scrape all jobs. Returns the progress of every job."""
+        for job in self.jobs:
+            for unit in job.open():
+                self._units.put(job, unit)
+            if job.done:
+                job.close()
+        if any(job.scraper_kwargs.get('fetch_mode', 'http') == 'http' for job in self.jobs):
+            self.article_fetcher = SF.ArticleFetcher(self.max_concurrent_fetches)
+        metrics_writer = None
+        if self.metrics_file is not None:
+            metrics_writer = SM.MetricsFileWriter(self.metrics_file, self.metrics_interval)
+            metrics_writer.start()
+
+        threads = [threading.Thread(target=self._worker, name=f'batch-worker-{i}', daemon=True)
+                   for i in range(1, self.workers+1)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not all(job.done for job in self.jobs):
+                try:
+                    job, unit, articles = self._units.results.get(timeout=1)
+                except queue.Empty:
+                    if not any(thread.is_alive() for thread in threads):
+                        raise SE.WorkerPoolException()
+                    continue
+                self._record(job, unit, articles)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.sessions.close()
+            if self.article_fetcher is not None:
+                self.article_fetcher.close()
+            for job in self.jobs:
+                if not job.done:
+                    job.close()
+            if metrics_writer is not None:
+                metrics_writer.stop()
+        return [job.progress() for job in self.jobs]
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('job_file', help='JSON or JSON lines file with the job specs')
+    parser.add_argument('--output-dir', default=Path.cwd(), help='Folder of the jobs without a save_to_location')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--max-concurrent-fetches', type=int, default=8)
+    parser.add_argument('--resume', action='store_true', help='Continue interrupted jobs from their journals')
+    parser.add_argument('--metrics-file', default=None)
+    parser.add_argument('--offline-driver', action='store_true', help='Only use the locally cached chromedriver')
+    parser.add_argument('--no-headless', dest='headless', action='store_false')
+    args = parser.parse_args(argv)
+
+    SL.add_console_handler(logging.INFO, sys.stdout)
+
+    jobs = expand_job_specs(load_job_specs(args.job_file), args.output_dir)
+    runner = BatchRunner(jobs,
+                         workers=args.workers,
+                         max_attempts=args.max_attempts,
+                         headless=args.headless,
+                         max_concurrent_fetches=args.max_concurrent_fetches,
+                         metrics_file=args.metrics_file,
+                         resume=args.resume,
+                         offline_driver=args.offline_driver or None)
+    json.dump(runner.run(), sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
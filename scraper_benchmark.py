@@ -0,0 +1,382 @@
+"""Offline benchmark of GoogleScraper against a local stand-in for Google Search and the article sites.
+
+Usage:
+    python scraper_benchmark.py --periods 4 --pages 2 --results-per-period 25 --latency 0.05
+
+The local server serves a home page, search results pages matching the XPaths GoogleScraper uses
+(both for navigation='url' and for the Tools panel / page links of navigation='ui') and synthetic
+article pages of varying size with injected latency. A share of the articles only renders its
+paragraphs with JavaScript, to exercise the browser fallback of the HTTP fetch path. Articles also
+reference images, a web font, a stylesheet and an ad script, so browser profiles can be compared:
+
+    python scraper_benchmark.py --compare-profiles
+
+and the post-processing of results pages can be timed on its own:
+
+    python scraper_benchmark.py --postprocessing
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+
+
+WORDS = ('airline stocks market shares investors flight travel demand quarter revenue analysts '
+         'price growth fuel costs carriers passengers earnings outlook report season').split()
+
+
+
+class BenchmarkConfig:
+    """Shape of the synthetic search results and articles.
+
+    Args:
+        results_per_period (int): Number of search results of every search period.
+        min_paragraphs (int): Smallest article size in paragraphs.
+        max_paragraphs (int): Largest article size in paragraphs.
+        latency (float): Seconds every article response is delayed by.
+        latency_jitter (float): Random extra delay of up to this many seconds.
+        js_share (float): Share of articles that render their paragraphs with JavaScript.
+        seed (int): Seed of the article contents.
+        images_per_article (int): Number of images every article references.
+        asset_kb (int): Size of every image, font, stylesheet and ad script in KB.
+        asset_latency (float): Seconds every asset response is delayed by.
+    """
+    def __init__(self, results_per_period=25, min_paragraphs=5, max_paragraphs=200, latency=0.05,
+                 latency_jitter=0.05, js_share=0.1, seed=0, images_per_article=4, asset_kb=50, asset_latency=0.05):
+        self.results_per_period = results_per_period
+        self.min_paragraphs = min_paragraphs
+        self.max_paragraphs = max_paragraphs
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.js_share = js_share
+        self.seed = seed
+        self.images_per_article = images_per_article
+        self.asset_kb = asset_kb
+        self.asset_latency = asset_latency
+
+
+
+def _article_content(rng, config):
+    """Random headers and paragraphs of a synthetic article."""
+    paragraphs = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+                  for _ in range(rng.randint(config.min_paragraphs, config.max_paragraphs))]
+    headers = [' '.join(rng.choice(WORDS) for _ in range(6)) for _ in range(4)]
+    return headers, paragraphs
+
+
+def _page(title, body, head=''):
+    return f'<!DOCTYPE html><html><head><title>{escape(title)}</title>{head}</head><body>{body}</body></html>'
+
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    config = BenchmarkConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, html, status=200, content_type='text/html; charset=utf-8'):
+        data = html.encode('utf-8') if isinstance(html, str) else html
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/':
+            self._send(self._home_page())
+        elif url.path == '/search':
+            self._send(self._results_page(query))
+        elif url.path.startswith('/article/'):
+            self._send(self._article_page(url.path[len('/article/'):]))
+        elif url.path.startswith('/static/') or url.path.startswith('/ads/'):
+            self._send_asset(url.path)
+        else:
+            self._send(_page('Not Found', '<p>Not Found</p>'), status=404)
+
+    ASSET_TYPES = {'.png': 'image/png', '.woff2': 'font/woff2', '.css': 'text/css', '.js': 'application/javascript'}
+
+    def _send_asset(self, path):
+        time.sleep(self.config.asset_latency)
+        content_type = self.ASSET_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        if content_type in ('text/css', 'application/javascript'):
+            # valid but meaningless code of the configured size
+            self._send(b'/*' + b' ' * max(self.config.asset_kb * 1024 - 4, 0) + b'*/', content_type=content_type)
+        else:
+            self._send(bytes(self.config.asset_kb * 1024), content_type=content_type)
+
+    def _home_page(self):
+        return _page('Google', '''
+            <div id="SIvCob">Google offered in: <a href="/?hl=en">English</a></div>
+            <form action="/search" method="get">
+                <input type="text" name="q" value="">
+                <input type="submit" value="Google Search">
+            </form>''')
+
+    def _results_page(self, query):
+        keyword = query.get('q', '')
+        tbs = dict(item.split(':', 1) for item in query.get('tbs', '').split(',') if ':' in item)
+        from_d, to_d = tbs.get('cd_min', ''), tbs.get('cd_max', '')
+        start = int(query.get('start', 0))
+        rank_stop = min(start + 10, self.config.results_per_period)
+
+        results = ''.join(f'''
+            <div class="g"><div class="rc">
+                <a href="/article/{(from_d + '-' + to_d).replace('/', '')}-{rank}"><h3>{escape(keyword)} result {rank}</h3></a>
+                <div><span class="f">{escape(from_d)} — </span><span>Snippet of result {rank}</span></div>
+            </div></div>''' for rank in range(start, rank_stop))
+
+        def search_url(**params):
+            return '/search?' + urlencode(dict({'q': keyword, 'tbs': query.get('tbs', '')}, **params))
+
+        page_count = -(-self.config.results_per_period // 10)
+        page_links = ''.join(f'<a aria-label="Page {page_no}" href="{escape(search_url(start=(page_no-1)*10))}">{page_no}</a> '
+                             for page_no in range(1, page_count+1))
+        go_script = ("var f = document.getElementById('OouJcb').value, t = document.getElementById('rzG2be').value;"
+                     f"location.href = {json.dumps('/search?' + urlencode({'q': keyword}))} + '&tbs=cdr:1,cd_min:' + f + ',cd_max:' + t;")
+        return _page(f'{keyword} - Google Search', f'''
+            <div id="hdtb-tls">Tools</div>
+            <div class="hdtb-mn-cont">
+                <div class="mn-hd-txt">Any time</div>
+                <span role="menuitem" jsaction="EEGHee" tabindex="-1">Custom range...</span>
+                <input type="text" id="OouJcb" value="">
+                <input type="text" id="rzG2be" value="">
+                <g-button class="Ru1Ao BwGU8e fE5Rge" onclick="{escape(go_script)}">Go</g-button>
+            </div>
+            <div id="rso">{results}</div>
+            <div id="navcnt">{page_links}</div>''')
+
+    def _article_page(self, article_id):
+        rng = random.Random(f'{self.config.seed}-{article_id}')
+        time.sleep(self.config.latency + rng.random() * self.config.latency_jitter)
+        header_texts, paragraphs = _article_content(rng, self.config)
+        headers = ''.join(f'<h{level}>{text}</h{level}>' for level, text in zip((1, 2, 2, 3), header_texts))
+        body = ''.join(f'<p>{paragraph}</p>' for paragraph in paragraphs)
+        if rng.random() < self.config.js_share:
+            body = f'<script>document.write({json.dumps(body)});</script>'
+        images = ''.join(f'<img src="/static/{article_id}-{i}.png">' for i in range(self.config.images_per_article))
+        head = ('<link rel="stylesheet" href="/static/site.css">'
+                '<style>@font-face {font-family: Site; src: url(/static/site.woff2);} body {font-family: Site;}</style>'
+                '<script async src="/ads/tag.js"></script>')
+        return _page(f'Article {article_id}', headers + images + body, head)
+
+
+
+def start_server(config):
+    """Start the stand-in server on a free local port.
+
+    Returns:
+        ThreadingHTTPServer: The running server, its URL is http://127.0.0.1:<server.server_port>/
+    """
+    handler = type('ConfiguredStandInHandler', (StandInHandler,), {'config': config})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='benchmark-server', daemon=True).start()
+    return server
+
+
+
+class RSSSampler(threading.Thread):
+    """Samples the peak resident memory of the browser process tree of a session in the background, across browser restarts."""
+    def __init__(self, session, interval=0.2):
+        super().__init__(name='benchmark-rss', daemon=True)
+        self.session = session
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, self.session.rss())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    @staticmethod
+    def process_peak_mb():
+        """Peak resident memory of this process in MB, None where the resource module does not exist (Windows)."""
+        try: import resource
+        except ImportError: return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB, on macOS in bytes
+        return round(peak / (1024**2 if sys.platform == 'darwin' else 1024), 1)
+
+
+
+def run_benchmark(config, periods=4, google_results_pages=2, periodicity='2D', **scraper_kwargs):
+    """Run GoogleScraper against the stand-in server and measure it.
+
+    Args:
+        config (BenchmarkConfig): Shape of the synthetic results and articles.
+        periods (int): Number of search periods to scrape.
+        google_results_pages (int): Number of results pages per period.
+        periodicity (str): Length of the search periods.
+        **scraper_kwargs: Further GoogleScraper arguments (fetch_mode, navigation, ...).
+
+    Returns:
+        dict: articles/sec, per-stage latency percentiles and counters from the scraper metrics, and peak memory of the run.
+    """
+    import scraper_classes as SC
+    import scraper_metrics as SM
+
+    # the stand-in server does not throttle, pacing would only measure the rate limits
+    scraper_kwargs.setdefault('rate_limiter', None)
+    server = start_server(config)
+    SM.METRICS.reset()
+    try:
+        with tempfile.TemporaryDirectory() as save_to_location:
+            scraper = SC.GoogleScraper(keyword='Airline Stocks',
+                                       search_start_date='06/01/2019',
+                                       periods=periods,
+                                       periodicity=periodicity,
+                                       google_results_pages=google_results_pages,
+                                       save_to_location=save_to_location,
+                                       google_url=f'http://127.0.0.1:{server.server_port}/',
+                                       **scraper_kwargs)
+            sampler = RSSSampler(scraper.session)
+            sampler.start()
+            start = time.perf_counter()
+            try:
+                scraper.scrape()
+            finally:
+                wall_time = time.perf_counter() - start
+                sampler.stop()
+                scraper.close()
+    finally:
+        server.shutdown()
+
+    metrics = SM.METRICS.snapshot()
+    return {'articles': scraper.articles_scraped_counter,
+            'wall_time_s': round(wall_time, 3),
+            'articles_per_sec': round(scraper.articles_scraped_counter / wall_time, 3) if wall_time else 0.0,
+            'stages': metrics['stages'],
+            'counters': metrics['counters'],
+            'browser_restarts': scraper.session.restarts,
+            'peak_rss_mb': {'scraper': RSSSampler.process_peak_mb(),
+                            'browser': round(sampler.peak / 1024**2, 1),
+                            },
+            }
+
+
+
+def benchmark_postprocessing(config, pages=500, articles_per_page=10, max_header_word_count=20, max_text_word_count=400):
+    """Time scraper_postprocessing.process_batch on results pages of synthetic articles, without a browser.
+
+    Returns:
+        dict: Milliseconds per results page and articles per second.
+    """
+    import scraper_postprocessing as SPost
+
+    rng = random.Random(config.seed)
+    batches = []
+    for page_no in range(pages):
+        batch = []
+        for rank in range(articles_per_page):
+            headers, paragraphs = _article_content(rng, config)
+            batch.append((f'Article {page_no}-{rank}', '.\n'.join(headers), '\n\n'.join(paragraphs), '06/01/2019', f'/article/{page_no}-{rank}'))
+        batches.append(batch)
+    start = time.perf_counter()
+    for batch in batches:
+        SPost.process_batch(batch, max_header_word_count, max_text_word_count)
+    elapsed = time.perf_counter() - start
+    return {'pages': pages,
+            'ms_per_page': round(elapsed * 1000 / pages, 3),
+            'articles_per_sec': round(pages * articles_per_page / elapsed, 1),
+            }
+
+
+
+def compare_profiles(config, profiles=('default', 'lean'), **benchmark_kwargs):
+    """Run the benchmark with every article opened in the browser, once per browser profile.
+
+    Returns:
+        dict: The report of every profile, and the bytes and milliseconds per article every profile saves
+        compared to the first one.
+    """
+    benchmark_kwargs['fetch_mode'] = 'browser'
+    reports, per_article = {}, {}
+    for profile in profiles:
+        report = run_benchmark(config, browser_profile=profile, **benchmark_kwargs)
+        counters = report['counters']
+        articles = counters.get(f'browser_articles_total{{profile={profile}}}', 0) or 1
+        per_article[profile] = {'bytes': counters.get(f'browser_article_bytes_total{{profile={profile}}}', 0) / articles,
+                                'ms': counters.get(f'browser_article_seconds_total{{profile={profile}}}', 0) * 1000 / articles}
+        reports[profile] = report
+    baseline = per_article[profiles[0]]
+    return {'profiles': reports,
+            'per_article': {profile: {'bytes': round(values['bytes']),
+                                      'ms': round(values['ms'], 1),
+                                      'bytes_saved': round(baseline['bytes'] - values['bytes']),
+                                      'ms_saved': round(baseline['ms'] - values['ms'], 1),
+                                      }
+                            for profile, values in per_article.items()},
+            }
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--periods', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--results-per-period', type=int, default=25)
+    parser.add_argument('--min-paragraphs', type=int, default=5)
+    parser.add_argument('--max-paragraphs', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--latency-jitter', type=float, default=0.05)
+    parser.add_argument('--js-share', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fetch-mode', choices=['http', 'browser'], default='http')
+    parser.add_argument('--navigation', choices=['url', 'ui'], default='url')
+    parser.add_argument('--max-concurrent-fetches', type=int, default=8)
+    parser.add_argument('--images-per-article', type=int, default=4)
+    parser.add_argument('--asset-kb', type=int, default=50)
+    parser.add_argument('--browser-profile', default='default', help='Browser profile of scraper_session.PROFILES')
+    parser.add_argument('--compare-profiles', action='store_true', help='Compare the default and lean profiles with every article opened in the browser')
+    parser.add_argument('--max-articles-per-browser', type=int, default=None, help='Restart the browser after this many articles')
+    parser.add_argument('--max-browser-rss-mb', type=float, default=None, help='Restart the browser above this memory')
+    parser.add_argument('--adaptive-periods', action='store_true', help='Merge sparse and split saturated periods while scraping')
+    parser.add_argument('--postprocessing', action='store_true', help='Only time the post-processing of results pages, without a browser')
+    parser.add_argument('--no-headless', dest='headless', action='store_false')
+    args = parser.parse_args(argv)
+
+    config = BenchmarkConfig(results_per_period=args.results_per_period,
+                             min_paragraphs=args.min_paragraphs,
+                             max_paragraphs=args.max_paragraphs,
+                             latency=args.latency,
+                             latency_jitter=args.latency_jitter,
+                             js_share=args.js_share,
+                             seed=args.seed,
+                             images_per_article=args.images_per_article,
+                             asset_kb=args.asset_kb)
+    benchmark_kwargs = dict(periods=args.periods,
+                            google_results_pages=args.pages,
+                            navigation=args.navigation,
+                            max_concurrent_fetches=args.max_concurrent_fetches,
+                            adaptive_periods=args.adaptive_periods,
+                            max_articles_per_browser=args.max_articles_per_browser,
+                            max_browser_rss_mb=args.max_browser_rss_mb,
+                            headless=args.headless)
+    if args.postprocessing:
+        report = benchmark_postprocessing(config)
+    elif args.compare_profiles:
+        report = compare_profiles(config, **benchmark_kwargs)
+    else:
+        report = run_benchmark(config, fetch_mode=args.fetch_mode, browser_profile=args.browser_profile, **benchmark_kwargs)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import scraper_exceptions as SE
+
+
+
+TRACKING_PARAMS = ('utm_', 'gclid', 'fbclid', 'mc_cid', 'mc_eid')
+
+
+
+def normalize_url(url):
+    """Normalize an article URL so the same article is found under a single key.
+
+    Lowercases the scheme and host, drops the fragment, default ports, trailing slashes
+    and tracking parameters, and sorts the remaining query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(':', 1)[-1]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parts.path.rstrip('/') or '/'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith(TRACKING_PARAMS))
+    return urlunsplit((scheme, netloc, path, urlencode(query), ''))
+
+
+
+class ArticleCache:
+    """Persistent SQLite cache of extracted article data keyed by normalized URL.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        ttl (float): Seconds after which an entry expires. None keeps entries forever.
+        max_entries (int): Maximum number of cached articles, least recently used entries are evicted first.
+    """
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path, ttl=7*24*3600, max_entries=100000):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS articles (
+                                        url TEXT PRIMARY KEY,
+                                        data TEXT NOT NULL,
+                                        created_at REAL NOT NULL,
+                                        accessed_at REAL NOT NULL)""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS articles_accessed_at ON articles (accessed_at)")
+        self._connection.commit()
+
+    @SE.ExceptionHandler(SE.CacheException, raise_error=False)
+    def get(self, url):
+        """Return the cached article data of a URL, or None on a miss."""
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT data, created_at FROM articles WHERE url = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE articles SET accessed_at = ? WHERE url = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    @SE.ExceptionHandler(SE.CacheException, raise_error=False)
+    def put(self, url, data):
+        """Store article data (a JSON serializable dict) under the URL."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO articles (url, data, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                                     (normalize_url(url), json.dumps(data), now, now))
+            self._puts += 1
+            # eviction scans the table, so it runs every EVICTION_INTERVAL writes instead of every write
+            if self._puts % self.EVICTION_INTERVAL == 0:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._connection.execute("DELETE FROM articles WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            self._connection.execute("""DELETE FROM articles WHERE url IN (
+                                            SELECT url FROM articles ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                                     (self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import scraper_exceptions as SE
+
+
+
+def journal_path(save_to_location, keyword, search_periods, adaptive=False):
+    """Path of the journal of a run, derived from the keyword and the searched date range."""
+    from_d = search_periods[0][0].strftime('%Y-%m-%d')
+    to_d = search_periods[-1][1].strftime('%Y-%m-%d')
+    plan = '_adaptive' if adaptive else ''
+    name = f'{keyword}_{from_d}_to_{to_d}_{len(search_periods)}_periods{plan}.journal.jsonl'.replace('/', '-').replace(' ', '_')
+    return Path(save_to_location) / name
+
+
+
+class RunJournal:
+    """Append-only JSON lines journal of the finished work of a scrape run.
+
+    The links of every results page are journaled once its articles are flushed to the output sinks,
+    so a crashed run can be resumed without scraping the same links again. Finished pages and periods,
+    and the last results page of periods that ran out of results, are journaled as well. Runs with adaptive
+    periods journal every period they plan (and the saturated period it was split from), the search results
+    of every finished page and period, and whether the period saturated the results pages, so the plan can be continued.
+
+    Args:
+        path (str): Location of the journal file.
+        resume (bool): Continue from an existing journal. Otherwise any existing journal is discarded.
+    """
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.done_periods = set()
+        self.done_pages = set()
+        self.last_pages = {}
+        self.planned_periods = {}
+        self.period_parents = {}
+        self.period_results = {}
+        self.saturated_periods = set()
+        self.page_results = {}
+        self._links = {}
+        self._lock = threading.Lock()
+        if resume and self.path.exists():
+            self._load()
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    @SE.ExceptionHandler(SE.CheckpointException, raise_error=True)
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try: record = json.loads(line)
+                except ValueError: continue # a line cut short by the crash
+                period_no = record['period']
+                if record['type'] == 'links':
+                    self._links.setdefault(period_no, set()).update(record['links'])
+                elif record['type'] == 'page':
+                    self.done_pages.add((period_no, record['page']))
+                    if 'results' in record:
+                        self.page_results[(period_no, record['page'])] = record['results']
+                elif record['type'] == 'last_page':
+                    self.last_pages[period_no] = record['page']
+                elif record['type'] == 'plan':
+                    self.planned_periods[period_no] = (record['from'], record['to'])
+                    if 'parent' in record:
+                        self.period_parents[period_no] = record['parent']
+                elif record['type'] == 'period':
+                    self.done_periods.add(period_no)
+                    self._links.pop(period_no, None)
+                    if 'results' in record:
+                        self.period_results[period_no] = record['results']
+                    if record.get('saturated'):
+                        self.saturated_periods.add(period_no)
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def links_done(self, period_no, page_no, links):
+        self._links.setdefault(period_no, set()).update(links)
+        self._write({'type': 'links', 'period': period_no, 'page': page_no, 'links': list(links)})
+
+    def page_done(self, period_no, page_no, results=None):
+        self.done_pages.add((period_no, page_no))
+        record = {'type': 'page', 'period': period_no, 'page': page_no}
+        if results is not None:
+            self.page_results[(period_no, page_no)] = results
+            record['results'] = results
+        self._write(record)
+
+    def set_last_page(self, period_no, page_no):
+        self.last_pages[period_no] = page_no
+        self._write({'type': 'last_page', 'period': period_no, 'page': page_no})
+
+    def plan_period(self, period_no, from_d, to_d, parent=None):
+        self.planned_periods[period_no] = (from_d, to_d)
+        record = {'type': 'plan', 'period': period_no, 'from': from_d, 'to': to_d}
+        if parent is not None:
+            self.period_parents[period_no] = parent
+            record['parent'] = parent
+        self._write(record)
+
+    def period_done(self, period_no, results=None, saturated=False):
+        self.done_periods.add(period_no)
+        self._links.pop(period_no, None)
+        record = {'type': 'period', 'period': period_no}
+        if results is not None:
+            self.period_results[period_no] = results
+            record['results'] = results
+        if saturated:
+            self.saturated_periods.add(period_no)
+            record['saturated'] = True
+        self._write(record)
+        os.fsync(self._file.fileno())
+
+    def is_period_done(self, period_no):
+        return period_no in self.done_periods
+
+    def is_page_done(self, period_no, page_no):
+        return (period_no, page_no) in self.done_pages
+
+    def is_past_last_page(self, period_no, page_no):
+        return period_no in self.last_pages and page_no > self.last_pages[period_no]
+
+    def period_links(self, period_no):
+        return set(self._links.get(period_no, ()))
+
+    def is_link_done(self, period_no, link):
+        return link in self._links.get(period_no, ())
+
+    def close(self):
+        self._file.close()
@@ -1,75 +1,119 @@
-import pandas as pd
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver import Chrome
-from selenium.webdriver import ChromeOptions
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import datetime
+import logging
 from dateutil.relativedelta import relativedelta
 import time
+from urllib.parse import urlencode
 from typing import List
 from abc import ABC, abstractproperty, abstractmethod
 
 import scraper_exceptions as SE
+import scraper_logging as SL
+from scraper_lazy import lazy_import
+import scraper_fetching as SF
+import scraper_cache as SCache
+import scraper_checkpoint as SCheckpoint
+import scraper_sinks as SSinks
+import scraper_extraction as SExtraction
+import scraper_postprocessing as SPost
+import scraper_metrics as SM
+import scraper_session as SSession
+import scraper_ratelimit as SRate
+import scraper_selectors as SSelectors
+import scraper_archive as SArchive
+import scraper_periods as SPeriods
+import scraper_tabs as STabs
 
 
 
-class ArticlePage(dict):
-    def __init__(self, title, headers, text, date, link, max_header_word_count=20, max_text_word_count=400, **kwargs):
-        super().__init__(title=title, headers=self.truncate_text(headers, max_header_word_count), text=self.truncate_text(text, max_text_word_count),date=date,link=link, **kwargs) 
-    @staticmethod
-    def truncate_text(string: str, max_words: int) -> str:
-        last_word_index = -1
-        spaces_count = 0
-        for i in range(len(string)):
-            if string[i] == ' ':
-                spaces_count += 1
-            if spaces_count == max_words:
-                last_word_index = i
-                return string[:last_word_index]
-        return string
-    @property
-    def word_count(self):
-        return self['text'].count(' ')+1
-
-
+LOGGER = logging.getLogger(__name__)
 
+# heavy dependencies are imported on first use
+pd = lazy_import('pandas')
+By = lazy_import('selenium.webdriver.common.by', 'By')
+WebDriverWait = lazy_import('selenium.webdriver.support.ui', 'WebDriverWait')
+EC = lazy_import('selenium.webdriver.support.expected_conditions')
+selenium_exceptions = lazy_import('selenium.common.exceptions')
 
 
 
 class BaseScraper:
+    # a page whose URL contains one of these is the site telling us to slow down
+    THROTTLED_URL_MARKERS = ()
     
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, session=None, driver_path=None, offline_driver=None, rate_limiter=SRate.LIMITER, browser_profile='default'):
+        """
+        Args:
+            headless (bool): Run Chrome without a window.
+            session (BrowserSession): Warm browser session to reuse (e.g. from a SessionManager), a new browser is started if None.
+            driver_path (str): chromedriver binary, resolved once and cached locally if None.
+            offline_driver (bool): Only use the locally cached chromedriver path, see scraper_session.resolve_driver_path.
+            rate_limiter (RateLimiter): Paces page loads per host, None to load pages unpaced.
+            browser_profile (BrowserProfile): Profile, or name of a profile in scraper_session.PROFILES ('default', 'lean'),
+                a new browser is started with. A session keeps the profile it was started with.
+        """
+        SL.create_logger()
         self.headless = headless
-        self._browser = self._open_new_browser()
+        self.driver_path = driver_path
+        self.offline_driver = offline_driver
+        self.rate_limiter = rate_limiter if rate_limiter is not None else SRate.NoRateLimiter()
+        # a session passed in by the caller outlives the scraper and is not quit by close
+        self._owns_session = session is None
+        self.browser_profile = session.profile if session is not None else SSession.get_profile(browser_profile)
+        self.session = session if session is not None else SSession.BrowserSession(self._open_new_browser(), self.browser_profile, self._open_new_browser)
         
     @property
     def browser(self):
-        return self._browser
+        return self.session.browser
+
+    def close(self):
+        """Quit the browser, unless it belongs to a session passed in by the caller."""
+        if self._owns_session:
+            self.session.close()
             
             
-    @SE.ExceptionHandler(SE.BrowserStartException, True)
     def _open_new_browser(self):
-        options = ChromeOptions()
-        prefs = {"profile.default_content_setting_values.notifications" : 2}
-        options.add_experimental_option("prefs",prefs)
-        if self.headless == True:
-            options.add_argument("--headless")
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--use-gl=desktop')
-        options.add_argument('--log-level=3')
-        options.add_argument("--disable-extensions")
-        options.add_argument("--incognito")
-        
-        browser = Chrome(executable_path=ChromeDriverManager().install(), options=options)
-        return browser
+        return SSession.open_browser(self.headless, self.driver_path, self.offline_driver, self.browser_profile)
     
         
+    @SM.METRICS.timed('navigation')
     @SE.ExceptionHandler(SE.BrowseToPageException, raise_error=True)
     def _browse_to_page(self, url):   
-        self.browser.get(url)
+        self._load_page(url)
+        self._raise_if_throttled(url)
+
+    def _load_page(self, url, started=None):
+        """Load url in the current tab, paced by the rate limiter.
+
+        A page that takes longer than the browser profile's page load timeout is stopped and used as far as it loaded.
+
+        Args:
+            url (str): Page to load.
+            started (callable): Called once the rate limiter lets the load start.
+        """
+        with self.rate_limiter.slot(url) as host:
+            if started is not None:
+                started()
+            start = time.perf_counter()
+            try: self.browser.get(url)
+            except selenium_exceptions.TimeoutException:
+                self.browser.execute_script('window.stop();')
+                SM.METRICS.inc('page_load_timeouts_total')
+            except:
+                host.failed()
+                raise
+        host.success(time.perf_counter() - start)
+
+    def _raise_if_throttled(self, url):
+        """Back off and raise ThrottledException if the browser was sent to a throttling page."""
+        if not self.THROTTLED_URL_MARKERS:
+            return
+        current_url = self.browser.current_url
+        if any(marker in current_url for marker in self.THROTTLED_URL_MARKERS):
+            LOGGER.warning(f'Throttled by {url}, backing off')
+            self.rate_limiter.host(url).throttled()
+            # the browser no longer shows the search any scraper prepared
+            self.session.owner = None
+            raise SE.ThrottledException()
         
     # The following methods were created to be used instead of the
     # original simple Selenium methods that search for elements immediately without
@@ -141,8 +185,16 @@ class BaseScraper:
 
 
 class GoogleScraper(BaseScraper):
+    RESULTS_PER_PAGE = 10
+    THROTTLED_URL_MARKERS = ('/sorry/',)
+    # search result layouts Google serves, shared by all scrapers so the layout found by one is tried first by all
+    SERP_RESULTS_SELECTOR = SSelectors.SelectorStrategy('serp_results', [
+        "//div[@id='rso']/div[@class='g']/div[@class='rc']", 
+        "//div[@class='hlcw0c']/div[@class='g']/div[@class='rc']", 
+        "//div[@class='g']/span/div[@class='rc']",
+        ])
     
-    def __init__(self, keyword, search_start_date, periods, save_to_location, browser_wait_time = 5, max_header_word_count=20, max_text_word_count=400, periodicity='M', google_results_pages=5, **kwargs):
+    def __init__(self, keyword, search_start_date, periods, save_to_location, browser_wait_time = 5, max_header_word_count=20, max_text_word_count=400, periodicity='M', google_results_pages=5, fetch_mode='http', max_concurrent_fetches=8, navigation='url', google_url='https://www.google.com/', article_cache=None, resume=False, sinks=None, dedup_index=None, metrics_file=None, metrics_interval=30, article_fetcher=None, max_throttle_retries=5, html_archive=None, adaptive_periods=False, max_merged_periods=8, max_articles_per_browser=None, max_browser_rss_mb=None, page_hang_timeout=120, **kwargs):
         super().__init__(**kwargs)
         self.keyword = keyword
         self.save_to_location = save_to_location
@@ -151,7 +203,53 @@ class GoogleScraper(BaseScraper):
         self.max_text_word_count = max_text_word_count
         self.google_results_pages = google_results_pages
         self.search_periods = self.generate_date_ranges(search_start_date, periods, periodicity)
+        # adaptive_periods=True lets scrape merge sparse and split saturated periods of this grid, see scraper_periods.PeriodPlanner
+        self.period_grid = self.search_periods
+        self.adaptive_periods = adaptive_periods
+        self.max_merged_periods = max_merged_periods
+        self.period_planner = None
         self.articles_scraped_counter = 0
+        # 'http' fetches articles concurrently and only opens a browser tab for pages that need JavaScript,
+        # 'browser' opens every article in a browser tab
+        self.fetch_mode = fetch_mode
+        # an article_fetcher passed in by the caller may be shared by several scrapers and is closed by the caller
+        self._owns_article_fetcher = article_fetcher is None
+        if article_fetcher is None and fetch_mode == 'http':
+            article_fetcher = SF.ArticleFetcher(max_concurrent_fetches, rate_limiter=self.rate_limiter)
+        self.article_fetcher = article_fetcher if fetch_mode == 'http' else None
+        # articles opened in the browser reuse one worker tab, the browser is restarted after max_articles_per_browser
+        # articles or above max_browser_rss_mb, and killed when an article takes longer than page_hang_timeout
+        self.tabs = STabs.TabManager(self.session, max_articles_per_browser, max_browser_rss_mb, page_hang_timeout)
+        # 'url' loads every (period, page) straight from a search URL, 'ui' sets the period through the Tools panel and clicks through pages
+        self.navigation = navigation
+        self.google_url = google_url
+        # article_cache can be an ArticleCache or the path of its SQLite file, a cache opened from a path is closed by close
+        self._owns_article_cache = article_cache is not None and not isinstance(article_cache, SCache.ArticleCache)
+        if self._owns_article_cache:
+            article_cache = SCache.ArticleCache(article_cache)
+        self.article_cache = article_cache
+        # html_archive can be an HTMLArchive or its directory, the raw HTML of every fetched article is stored in it for re-extraction,
+        # an archive opened from a directory is closed by close
+        self._owns_html_archive = html_archive is not None and not isinstance(html_archive, SArchive.HTMLArchive)
+        if self._owns_html_archive:
+            html_archive = SArchive.HTMLArchive(html_archive)
+        self.html_archive = html_archive
+        # resume=True continues an interrupted run from its journal in save_to_location
+        self.resume = resume
+        self.journal = None
+        # articles are streamed to the sinks as soon as they are extracted, by default to one CSV file per period
+        # a URLIndex shared by all periods (and runs, if saved), articles already in it are not opened again
+        self.dedup_index = dedup_index
+        # metrics snapshots are written to metrics_file (.prom for the Prometheus format, JSON otherwise) during scrape
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        # how many times scrape tries a results page Google throttled, each after the rate limiter's backoff
+        self.max_throttle_retries = max_throttle_retries
+        self._owns_sinks = sinks is None
+        self.sinks = sinks if sinks is not None else [SSinks.CSVSink(save_to_location, append=resume)]
+        self._search_prepared = False
+        self._current_period = None
+        self._serp_results = 0
 
     @SE.ExceptionHandler(SE.BrowserStartException, raise_error=True)
     def _change_google_to_english(self):
@@ -159,23 +257,32 @@ class GoogleScraper(BaseScraper):
         lang_panel.find_element_by_xpath("//*[contains(text(), 'English')]").click()
           
           
+    @SE.ExceptionHandler(SE.InfoCollectionException, raise_error=False)
+    def _extract_article_payload(self):
+        """Collect title, headers and paragraphs of the current page with a single script call.
+
+        Returns:
+            dict: {'title': str, 'headers': list[str], 'paragraphs': list[str]}
+        """
+        # give the page time to render its paragraphs, pages without any are still extracted
+        try: self._get_elements_by_css_selector('p', self.browser_wait_time)
+        except: pass
+        return self.browser.execute_script(SExtraction.ARTICLE_SCRIPT)
+
+
     @SE.ExceptionHandler(SE.InfoCollectionException, raise_error=False)
     def _collect_p_tags(self):
-        paragraphs = self._get_elements_by_css_selector('p', self.browser_wait_time)
-        return ' '.join([para.text for para in paragraphs])
+        return ' '.join(self._extract_article_payload()['paragraphs'])
 
 
     @SE.ExceptionHandler(SE.InfoCollectionException, raise_error=False)
     def _collect_h_tags(self):
-        header_elements = self._get_elements_by_css_selector("h1, h2, h3, h4, h5, h6", self.browser_wait_time)
-        return '. '.join([header.text for header in header_elements])
+        return '. '.join(self._extract_article_payload()['headers'])
 
 
     @SE.ExceptionHandler(SE.InfoCollectionException, raise_error=False)     
     def _collect_title(self):
-        return (self._get_element_by_xpath('/html/head/title', self.browser_wait_time)
-                    .get_attribute('textContent')
-                    .strip())
+        return self._extract_article_payload()['title']
 
     
     @staticmethod
@@ -211,6 +318,7 @@ class GoogleScraper(BaseScraper):
 
 
 
+    @SM.METRICS.timed('date_range')
     @SE.ExceptionHandler(SE.DateRangeGenerationException, raise_error=True)
     def _set_custom_date_period(self, from_date, to_date, current_period):
         """Set a custom search period in Google Search.
@@ -258,89 +366,174 @@ class GoogleScraper(BaseScraper):
     @staticmethod
     @SE.ExceptionHandler(SE.DateLinkCollectionException, raise_error=False)
     def _collect_date_link_from_element(element):
-        href = element.find_element_by_tag_name('a').get_attribute('href')
-        date = (element.find_element_by_class_name("f")
-                    .get_attribute('textContent')
-                    .split('—')[0]
-                    .strip())
-        return href, date
+        entry = element.parent.execute_script(SExtraction.SERP_ENTRY_SCRIPT, element)
+        return entry['href'], entry['date']
         
         
+    @SM.METRICS.timed('serp_parse')
     @SE.ExceptionHandler(SE.DateLinkCollectionException, raise_error=True)
-    def _collect_dates_links(self, xpaths_to_try):
-        for xpath in xpaths_to_try:
-            try:
-                page_results = self._get_elements_by_xpath(xpath)
-                if page_results:
-                    print('page_results: ', len(page_results))
-                    break
-            except: pass
-        dates = []
-        links = []
-        for result in page_results:
-            try:
-                link, date = self._collect_date_link_from_element(result)
-                links.append(link)
-                dates.append(date)
-            except: pass
+    def _collect_dates_links(self, selector):
+        """Collect the dates and links of the search results.
+
+        Args:
+            selector (SelectorStrategy): Candidate XPaths of the search result elements.
+
+        Raises:
+            NoSearchResultsException: No search results on the page, e.g. a results page past the last one or
+                a period nothing was published in, callers end the period.
+        """
+        # a single wait for whichever layout is served, then one script call finds the matching XPath and collects the results
+        if not selector.wait(self.browser, self.browser_wait_time):
+            selector.record(None)
+            raise SE.NoSearchResultsException()
+        candidates = selector.ordered()
+        result = self.browser.execute_script(SExtraction.SERP_SCRIPT, candidates)
+        if result['matched'] < 0:
+            selector.record(None)
+            raise SE.NoSearchResultsException()
+        selector.record(candidates[result['matched']])
+        entries = result['entries']
+        LOGGER.debug(f'page_results: {len(entries)}')
+        dates = [entry['date'] for entry in entries]
+        links = [entry['href'] for entry in entries]
         return dates, links
 
 
-    @SE.ExceptionHandler(SE.ResultsPageCollectionException, raise_error=True)
-    def _collect_search_results_article_data(self):
-        main_tab = self.browser.window_handles[0] # save the handle of the main search tab
-
-        xpaths_to_try = ["//div[@id='rso']/div[@class='g']/div[@class='rc']", 
-                         "//div[@class='hlcw0c']/div[@class='g']/div[@class='rc']", 
-                         "//div[@class='g']/span/div[@class='rc']",
-                         ]
-        dates, links = self._collect_dates_links(xpaths_to_try)
-        results_page = []
-    
-        for date, link in zip(dates, links):
-            self.browser.execute_script(f"window.open('{link}', 'new window')") # open link in a new tab
-            self.browser.switch_to.window(window_name=self.browser.window_handles[1]) # switch Selenium to the new tab
+    @SM.METRICS.timed('article_fetch')
+    def _collect_article_with_browser(self, link):
+        """Open the link in a worker tab and collect title, headers and text through Selenium.
 
-            print('\ndate: ', date)
-            print('link: ', link)
-            
-            try: title = self._collect_title()
-            except: title = ''
-            if title == None:
-                title = ''
-            print('Title word count: ', title.count(' ')+1)
-            
-            try: headers = self._collect_h_tags()
-            except: headers = ''
-            if headers == None:
-                headers = ''
-            print('Headers original word count: ', headers.count(' ')+1 if len(headers)>0 else 0)
-            
-            try: text = self._collect_p_tags()
-            except: text = ''
-            if text == None:
-                text = ''
-            print('Text original word count: ', text.count(' ')+1 if len(text)>0 else 0)
-
-            article = ArticlePage(title = title, 
-                                  headers = headers, 
-                                  text = text, 
-                                  link = link, 
-                                  date = date,
-                                  max_header_word_count = self.max_header_word_count,
-                                  max_text_word_count = self.max_text_word_count,
-                                  ) 
-            
-            self.articles_scraped_counter+=1
-            print('Articles scraped: ', self.articles_scraped_counter)
+        Returns:
+            tuple(str, str, str): title, headers and text of the article, empty if its page did not load or hung.
+        """
+        title, headers, text = '', '', ''
+        with self.tabs.worker_tab():
+            # the reused tab shows the previous article until a navigation commits, so it is cleared first
+            # and a link that never commits leaves it on about:blank instead of on the previous article
+            try: self.browser.get('about:blank')
+            except:
+                LOGGER.debug('Could not clear the worker tab')
+                return title, headers, text
+            # the link is loaded through the driver so the profile's load strategy and timeout apply,
+            # the hang watchdog is paused while the load waits for the rate limiter and starts over with the load
+            self.tabs.pause()
+            start = time.perf_counter()
+            try: self._load_page(link, started=self.tabs.watch)
+            except: LOGGER.debug(f'Could not load {link}')
+            if self.browser.current_url == 'about:blank':
+                LOGGER.debug(f'{link} did not load')
+                return title, headers, text
+
+            payload = self._extract_article_payload()
+            self._record_page_stats(time.perf_counter() - start)
+            if self.html_archive is not None:
+                self.html_archive.store(link, self.browser.page_source, 'browser')
+            if payload is not None:
+                title = payload['title']
+                headers = '. '.join(payload['headers'])
+                text = ' '.join(payload['paragraphs'])
+        return title, headers, text
+
+
+    @SE.ExceptionHandler(SE.InfoCollectionException, raise_error=False)
+    def _record_page_stats(self, elapsed):
+        """Count the bytes the current tab transferred and the time it took, per browser profile.
+
+        Comparing browser_article_bytes_total / browser_articles_total (and the seconds) of two profiles
+        gives the bytes and time one saves per article, see scraper_benchmark.compare_profiles.
+        """
+        stats = self.browser.execute_script(SExtraction.PAGE_STATS_SCRIPT)
+        profile = self.browser_profile.name
+        SM.METRICS.inc('browser_articles_total', profile=profile)
+        SM.METRICS.inc('browser_article_bytes_total', int(stats['bytes']), profile=profile)
+        SM.METRICS.inc('browser_article_seconds_total', round(elapsed, 6), profile=profile)
+        LOGGER.debug(f'profile: {profile}; bytes: {stats["bytes"]}; resources: {stats["resources"]}; seconds: {elapsed:.3f}')
 
-            self.browser.close() # close the article tab
-            self.browser.switch_to.window(window_name=main_tab) # return to main search tab
 
-            results_page.append(article)
+    @SE.ExceptionHandler(SE.ResultsPageCollectionException, raise_error=True)
+    def _collect_search_results_article_data(self, period_no=None, page_no=None):
+        dates, links = self._collect_dates_links(self.SERP_RESULTS_SELECTOR)
+        self._serp_results = len(links)
+        raw_articles = []
+
+        # links collected before an interrupted run stopped are not scraped again
+        if self.journal is not None:
+            dates_links = [(date, link) for date, link in zip(dates, links) if not self.journal.is_link_done(period_no, link)]
+            dates, links = [date for date, _ in dates_links], [link for _, link in dates_links]
+
+        # articles already found in another period or results page are skipped
+        if self.dedup_index is not None:
+            dates_links = [(date, link) for date, link in zip(dates, links) if not self.dedup_index.is_duplicate(link)]
+            if len(dates_links) < len(links):
+                LOGGER.info(f'Duplicate links skipped: {len(links) - len(dates_links)}')
+                SM.METRICS.inc('duplicate_links_skipped_total', len(links) - len(dates_links))
+            dates, links = [date for date, _ in dates_links], [link for _, link in dates_links]
+
+        # articles fetched before are taken from the cache and not downloaded again
+        if self.article_cache is not None:
+            cached_articles = [self.article_cache.get(link) for link in links]
+            # the archive has to hold the page of every result it records, cached articles it lacks are fetched again
+            if self.html_archive is not None:
+                cached_articles = [cached if cached is None or self.html_archive.contains(link) else None
+                                   for link, cached in zip(links, cached_articles)]
+        else:
+            cached_articles = [None] * len(links)
+        links_to_fetch = [link for link, cached in zip(links, cached_articles) if cached is None]
+
+        # fetch every article of the results page at once, pages that need JavaScript fall back to the browser
+        if self.article_fetcher is not None:
+            fetched_articles = dict(zip(links_to_fetch, self.article_fetcher.fetch_many(links_to_fetch)))
+        else:
+            fetched_articles = {}
+    
+        for date, link, cached in zip(dates, links, cached_articles):
+            LOGGER.debug(f'date: {date}; link: {link}')
+
+            fetched = fetched_articles.get(link)
+            if cached is not None:
+                source = 'cache'
+                title, headers, text = cached['title'], cached['headers'], cached['text']
+            elif fetched is None or fetched.needs_browser:
+                source = 'browser'
+                title, headers, text = self._collect_article_with_browser(link)
+            else:
+                source = 'http'
+                title, headers, text = fetched.title, fetched.headers, fetched.text
+                if self.html_archive is not None:
+                    self.html_archive.store(link, fetched.html, 'http')
+            # a failed extraction (no text) is not cached, the article is fetched again next time instead of for the whole TTL
+            if cached is None and self.article_cache is not None and text:
+                self.article_cache.put(link, {'title': title, 'headers': headers, 'text': text})
+            SM.METRICS.inc('articles_total', source=source)
+            LOGGER.debug(f'source: {source}; title word count: {title.count(" ")+1}; '
+                         f'headers original word count: {headers.count(" ")+1 if len(headers)>0 else 0}; '
+                         f'text original word count: {text.count(" ")+1 if len(text)>0 else 0}')
+            raw_articles.append((title, headers, text, date, link))
+
+        # truncation and word counts are done for the whole results page at once
+        with SM.METRICS.time('serp_extraction'):
+            results_page = SPost.process_batch(raw_articles, self.max_header_word_count, self.max_text_word_count)
+        if period_no is not None:
+            from_d, to_d = self.period_dates(period_no)
+            with SM.METRICS.time('write'):
+                for article in results_page:
+                    for sink in self.sinks:
+                        sink.write(article, self.keyword, from_d, to_d)
+            if self.html_archive is not None:
+                self.html_archive.record_results(self.keyword, from_d, to_d, [(article.date, article.link) for article in results_page])
+        # links are only indexed once scraped, so a failed page that is retried does not lose them,
+        # and articles that came back without text are tried again when found in another period or page
+        if self.dedup_index is not None:
+            for article in results_page:
+                if article.text:
+                    self.dedup_index.add(article.link)
+        self.articles_scraped_counter += len(results_page)
+        SM.METRICS.inc('results_pages_total')
+        LOGGER.info(f'Articles scraped: {self.articles_scraped_counter}')
         return results_page
 
 
+    @SM.METRICS.timed('navigation')
     @SE.ExceptionHandler(SE.ClickException, raise_error=True)
     def _next_google_results_page(self, page_no):
         """Open a specific google search page in search results window.
@@ -353,54 +546,258 @@ class GoogleScraper(BaseScraper):
 
 
 
+    def _prepare_search(self):
+        """Open Google in English, submit the keyword and open the Tools panel.
+
+        Steps the browser session has already been through for an earlier job are skipped: the language
+        setting is kept by Google for the whole browser session and the Tools panel stays open across searches.
+        """
+        if not self.session.language_set:
+            self._browse_to_page(self.google_url)
+            self._change_google_to_english()
+            self.session.language_set = True
+            self._get_element_by_xpath('//input[@type="text"]').send_keys(self.keyword) #enter keyword
+            time.sleep(0.5)
+            self._get_element_by_xpath("//input[@type='submit']").click() #submit keyword for search
+        else:
+            self._browse_to_page(f"{self.google_url.rstrip('/')}/search?{urlencode({'q': self.keyword, 'hl': 'en'})}")
+        if not self.session.tools_open:
+            xpath = '//div[@id="hdtb-tls"]'
+            self._get_element_by_xpath(xpath).click() # clicking Tools button, stays active during subsequent results pages so no need to repeat step
+            self.session.tools_open = True
+        self._search_prepared = True
+        self._current_period = None
+        self.session.owner = self
+
+
+    def period_dates(self, period_no):
+        """Return the (MM/DD/YYYY) start and end date strings of a search period.
+
+        Args:
+            period_no (int): Number of the period in self.search_periods, starting from 1.
+        """
+        from_d, to_d = self.search_periods[period_no-1]
+        return from_d.strftime('%m/%d/%Y'), to_d.strftime('%m/%d/%Y')
+
+
+    def build_search_url(self, from_date, to_date, page_no=1):
+        """Build the URL of a search results page restricted to a custom date range.
+
+        Args:
+            from_date (str): (format MM/DD/YYYY) Start of period.
+            to_date (str): (format MM/DD/YYYY) End of period.
+            page_no (int): Number of search results page.
+        """
+        params = {'q': self.keyword,
+                  'hl': 'en',
+                  'tbs': f'cdr:1,cd_min:{from_date},cd_max:{to_date}',
+                  }
+        if page_no > 1:
+            params['start'] = (page_no-1) * self.RESULTS_PER_PAGE
+        return f"{self.google_url.rstrip('/')}/search?{urlencode(params)}"
+
+
+    def scrape_results_page(self, period_no, page_no):
+        """Collect the articles of one search results page of one search period.
+
+        With navigation='url' the page is loaded directly from its search URL, so any unit can be scraped
+        independently. With navigation='ui' the browser only sets the date period again when it is not
+        already showing the requested period, so consecutive pages of the same period cost a single click each.
+
+        Args:
+            period_no (int): Number of the period in self.search_periods, starting from 1.
+            page_no (int): Number of search results page.
+
+        Raises:
+            ThrottledException: Google answered with its throttling page, the unit should be tried again later.
+            NoSearchResultsException: The results page has no search results, the period ends before it.
+
+        Returns:
+            list[ArticleRecord]: Articles found on the results page.
+        """
+        if self.navigation == 'url':
+            from_d, to_d = self.period_dates(period_no)
+            self._browse_to_page(self.build_search_url(from_d, to_d, page_no))
+            self._current_period = period_no
+            return self._collect_search_results_article_data(period_no, page_no)
+
+        # another scraper sharing the browser session may have moved it to a different search
+        if self.session.owner is not self:
+            self._search_prepared = False
+        if not self._search_prepared:
+            self._prepare_search()
+        # clicks load search pages as well and are paced like _browse_to_page
+        with self.rate_limiter.slot(self.google_url):
+            if page_no == 1 or self._current_period != period_no:
+                from_d, to_d = self.period_dates(period_no)
+                self._current_period = None
+                self._set_custom_date_period(from_d, to_d, period_no)
+                self._current_period = period_no
+            if page_no > 1:
+                self._next_google_results_page(str(page_no))
+        self._raise_if_throttled(self.google_url)
+        return self._collect_search_results_article_data(period_no, page_no)
+
+
+    def close(self):
+        if self.article_fetcher is not None and self._owns_article_fetcher:
+            self.article_fetcher.close()
+        if self.article_cache is not None:
+            LOGGER.info(f'Article cache: {self.article_cache.stats()}')
+            if self._owns_article_cache:
+                self.article_cache.close()
+        if self.html_archive is not None:
+            LOGGER.info(f'HTML archive: {self.html_archive.stats(disk_usage=False)}')
+            # pages stored after the last recorded results page (e.g. of an interrupted page) are committed as well
+            if self._owns_html_archive:
+                self.html_archive.close()
+            else:
+                self.html_archive.commit()
+        LOGGER.info(f'SERP selector: {self.SERP_RESULTS_SELECTOR.stats()}')
+        if self.dedup_index is not None:
+            LOGGER.info(f'Dedup index: {self.dedup_index.stats()}')
+            self.dedup_index.save()
+        # sinks passed in by the caller may be shared and are closed by the caller
+        if self._owns_sinks:
+            for sink in self.sinks:
+                sink.close()
+        super().close()
+
+
     def scrape(self):
         """Scrape Google Search for text on entered keyword and for set date period. Saves files to specified location.
+
+        Articles are streamed to the sinks as they are collected and progress is journaled in save_to_location after
+        every results page. With resume=True finished periods and pages are skipped and unfinished periods are appended to.
+        With adaptive_periods=True the periods are planned while scraping and self.search_periods lists the periods planned so far.
         """
-        self._browse_to_page('https://www.google.com/')
-        self._change_google_to_english()
-        self._get_element_by_xpath('//input[@type="text"]').send_keys(self.keyword) #enter keyword
-        time.sleep(0.5)
-        self._get_element_by_xpath("//input[@type='submit']").click() #submit keyword for search
-        
+        self.journal = SCheckpoint.RunJournal(SCheckpoint.journal_path(self.save_to_location, self.keyword, self.period_grid, self.adaptive_periods),
+                                              resume=self.resume)
+        if self.adaptive_periods:
+            self.period_planner = SPeriods.PeriodPlanner(self.period_grid, self.google_results_pages * self.RESULTS_PER_PAGE,
+                                                         max_merged_periods=self.max_merged_periods)
+            self.period_planner.restore(self.journal.planned_periods, self.journal.done_periods, self.journal.period_results,
+                                        self.journal.period_parents, self.journal.saturated_periods)
+            self.search_periods = self.period_planner.periods
+        metrics_writer = None
+        if self.metrics_file is not None:
+            metrics_writer = SM.MetricsFileWriter(self.metrics_file, self.metrics_interval)
+            metrics_writer.start()
+        try:
+            self._scrape_periods()
+        finally:
+            if metrics_writer is not None:
+                metrics_writer.stop()
+            self.journal.close()
+            self.journal = None
+
+
+    def _scrape_results_page_unthrottled(self, period_no, page_no):
+        """scrape_results_page, tried again after the rate limiter's backoff while Google throttles.
+
+        Returns None if the results page has no search results, or a results page after the first one does not load.
+        """
+        for attempt in range(1, self.max_throttle_retries+1):
+            try:
+                return self.scrape_results_page(period_no, page_no)
+            except SE.ThrottledException:
+                LOGGER.info(f'period {period_no}, page {page_no} throttled (attempt {attempt}), retrying')
+            except SE.NoSearchResultsException:
+                return None
+            except:
+                if page_no == 1:
+                    raise
+                return None
+        raise SE.ThrottledException()
+
+
+    def _scrape_periods(self):
+        if self.period_planner is not None:
+            self._scrape_planned_periods()
+            return
         # loop through date periods
-        current_period = 1
-        for from_d, to_d in self.search_periods:
-            period_contents = []
-            from_d = from_d.strftime('%m/%d/%Y')
-            to_d = to_d.strftime('%m/%d/%Y')
-            # ensure the current results page is not larger than variable "google_results_pages"
-            current_page = 1
-            while current_page <= self.google_results_pages:
-                print(f'\n\ncurrent_period: {current_period}; total_periods: {len(self.search_periods)}')
-                print(f'current_page: {current_page}; google_results_pages: {self.google_results_pages}')
+        for current_period in range(1, len(self.search_periods)+1):
+            if self.journal.is_period_done(current_period):
+                LOGGER.info(f'current_period: {current_period} already scraped, skipping')
+                continue
+            self._scrape_period(current_period)
+            self._period_done(current_period)
+
+
+    def _scrape_planned_periods(self):
+        """Scrape the periods of self.period_planner in the order it plans them.
+
+        The links scraped in a period that saturated the results pages are journaled as done in its halves
+        (as page 0), so the halves skip them, also when the run is resumed.
+        """
+        while True:
+            current_period = self.period_planner.next_period()
+            self._journal_planned_periods()
+            if current_period is None:
+                break
+            results, saturated = self._scrape_period(current_period)
+            halves = self.period_planner.record(current_period, results, saturated)
+            self._journal_planned_periods()
+            for half in halves:
+                self.journal.links_done(half, 0, self.journal.period_links(current_period))
+            self._period_done(current_period, results, saturated)
+
+
+    def _journal_planned_periods(self):
+        for period_no in range(len(self.journal.planned_periods)+1, len(self.period_planner.periods)+1):
+            from_d, to_d = self.period_planner.periods[period_no-1]
+            self.journal.plan_period(period_no, from_d.strftime('%Y-%m-%d'), to_d.strftime('%Y-%m-%d'),
+                                     self.period_planner.parents.get(period_no))
+
+
+    def _scrape_period(self, current_period):
+        """Scrape the results pages of a period.
+
+        Returns:
+            tuple(int, bool): Search results listed on the pages scraped, and whether the last allowed page was full.
+        """
+        results, saturated = 0, False
+        # ensure the current results page is not larger than variable "google_results_pages"
+        for current_page in range(1, self.google_results_pages+1):
+            if self.journal.is_past_last_page(current_period, current_page):
+                break
+            if self.journal.is_page_done(current_period, current_page):
+                # pages scraped before an interrupted run stopped still count towards the period's results
+                page_results = self.journal.page_results.get((current_period, current_page), 0)
+                results += page_results
+                saturated = self._saturates(current_page, page_results)
+                continue
+            LOGGER.info(f'current_period: {current_period}; total_periods: {len(self.search_periods)}; '
+                        f'current_page: {current_page}; google_results_pages: {self.google_results_pages}')
+            content = self._scrape_results_page_unthrottled(current_period, current_page)
+            if content is None:
+                # a missing results page ends the period, a period without any results is done with last page 0
                 if current_page == 1:
-                    if current_period == 1:
-                        xpath = '//div[@id="hdtb-tls"]'
-                        self._get_element_by_xpath(xpath).click() # clicking Tools button, stays active during subsequent results pages so no need to repeat step
-                    self._set_custom_date_period(from_d, to_d, current_period)
-                    content = self._collect_search_results_article_data()
-                    period_contents.extend(content)
-                    current_page += 1
-
-                elif current_page > 1:
-                    try:
-                        self._next_google_results_page(str(current_page))
-                        content = self._collect_search_results_article_data()
-                        period_contents.extend(content)
-                        current_page += 1
-                    except:
-                        current_page = self.google_results_pages+1
-            current_period +=1
-
-            period_contents_df = pd.DataFrame({
-                'title': list(map(lambda x: x['title'], period_contents)),
-                'headers': list(map(lambda x: x['headers'], period_contents)),
-                'text': list(map(lambda x: x['text'], period_contents)),
-                'date': list(map(lambda x: x['date'], period_contents)),
-                'link': list(map(lambda x: x['link'], period_contents)),
-            })
-            columns = ['title','headers','text','date','link']
-            period_contents_df = period_contents_df.reindex(columns=columns)
-
-            save_to = f'{self.save_to_location}\\{from_d}_to_{to_d}_{self.keyword}.csv'.replace('/', '-').replace(' ', '_')
-            period_contents_df.to_csv(save_to)
+                    LOGGER.info(f'current_period: {current_period} has no search results')
+                self.journal.set_last_page(current_period, current_page-1)
+                break
+            results += self._serp_results
+            saturated = self._saturates(current_page, self._serp_results)
+            # the page is journaled only once its articles are written out
+            with SM.METRICS.time('write'):
+                for sink in self.sinks:
+                    sink.flush()
+            self.journal.links_done(current_period, current_page, [article['link'] for article in content])
+            self.journal.page_done(current_period, current_page, self._serp_results)
+        return results, saturated
+
+
+    def _saturates(self, page_no, page_results):
+        """Whether a results page is the last allowed one and full, so the period's results were cut off."""
+        return page_no == self.google_results_pages and page_results >= self.RESULTS_PER_PAGE
+
+
+    def _period_done(self, current_period, results=None, saturated=False):
+        from_d, to_d = self.period_dates(current_period)
+        with SM.METRICS.time('write'):
+            for sink in self.sinks:
+                sink.close_period(self.keyword, from_d, to_d)
+        if self.dedup_index is not None:
+            self.dedup_index.save()
+        self.journal.period_done(current_period, results, saturated)
+        SM.METRICS.inc('periods_total')
@@ -0,0 +1,144 @@
+import hashlib
+import math
+import struct
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import scraper_cache as SCache
+import scraper_exceptions as SE
+
+
+
+class URLIndex(ABC):
+    """Run-wide index of the article URLs that were already scraped.
+
+    URLs are normalized like the article cache keys, so the same article found in several search periods
+    or results pages is only opened once. The index can be saved to a file and loaded again by later runs.
+
+    Args:
+        path (str): File the index is loaded from (if it exists) and saved to. None keeps the index in memory.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        self.added = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    @staticmethod
+    def _digest(url):
+        return hashlib.blake2b(SCache.normalize_url(url).encode('utf-8'), digest_size=16).digest()
+
+    def is_duplicate(self, url):
+        """Check whether the URL is already in the index, counting it as skipped if it is."""
+        digest = self._digest(url)
+        with self._lock:
+            if self._contains(digest):
+                self.skipped += 1
+                return True
+            return False
+
+    def add(self, url):
+        """Add the URL of a scraped article to the index."""
+        digest = self._digest(url)
+        with self._lock:
+            if not self._contains(digest):
+                self._add(digest)
+                self.added += 1
+
+    @SE.ExceptionHandler(SE.DedupIndexException, raise_error=False)
+    def save(self):
+        if self.path is None:
+            return
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with self._lock:
+            with open(temp_path, 'wb') as f:
+                self._dump(f)
+        temp_path.replace(self.path)
+
+    @SE.ExceptionHandler(SE.DedupIndexException, raise_error=True)
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            self._read(f)
+
+    def stats(self):
+        return {'added': self.added, 'skipped': self.skipped}
+
+    @abstractmethod
+    def _contains(self, digest):
+        pass
+
+    @abstractmethod
+    def _add(self, digest):
+        pass
+
+    @abstractmethod
+    def _dump(self, f):
+        pass
+
+    @abstractmethod
+    def _read(self, f):
+        pass
+
+
+
+class ExactURLIndex(URLIndex):
+    """URL index keeping a 16 byte hash of every URL, no false positives."""
+    def __init__(self, path=None):
+        self._digests = set()
+        super().__init__(path)
+
+    def _contains(self, digest):
+        return digest in self._digests
+
+    def _add(self, digest):
+        self._digests.add(digest)
+
+    def _dump(self, f):
+        f.write(b''.join(self._digests))
+
+    def _read(self, f):
+        data = f.read()
+        self._digests.update(data[i:i+16] for i in range(0, len(data), 16))
+
+
+
+class BloomURLIndex(URLIndex):
+    """Bloom filter URL index with a fixed memory footprint for very long runs.
+
+    A false positive skips an article that was not scraped yet, with probability error_rate
+    while the index holds up to capacity URLs.
+
+    Args:
+        capacity (int): Expected number of URLs.
+        error_rate (float): Accepted false positive rate at full capacity.
+    """
+    HEADER = struct.Struct('<QQ')
+
+    def __init__(self, path=None, capacity=1000000, error_rate=0.001):
+        self.bit_count = max(int(-capacity * math.log(error_rate) / math.log(2)**2), 8)
+        self.hash_count = max(int(round(self.bit_count / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.bit_count + 7) // 8)
+        super().__init__(path)
+
+    def _positions(self, digest):
+        # double hashing, the two halves of the digest generate all hash functions
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def _contains(self, digest):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def _add(self, digest):
+        for pos in self._positions(digest):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def _dump(self, f):
+        f.write(self.HEADER.pack(self.bit_count, self.hash_count))
+        f.write(self._bits)
+
+    def _read(self, f):
+        self.bit_count, self.hash_count = self.HEADER.unpack(f.read(self.HEADER.size))
+        self._bits = bytearray(f.read())
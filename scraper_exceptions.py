@@ -1,8 +1,11 @@
+import functools
+import time
+
 from scraper_logging import create_logger
+from scraper_metrics import METRICS
 
 
 class ExceptionHandler(object):
-    LOGGER = create_logger()
     
     def __init__(self, error, raise_error=False, info={}):
         self.error = error
@@ -10,14 +13,22 @@ class ExceptionHandler(object):
         self.info = info
 
     def __call__(self, function):
+        @functools.wraps(function)
         def wrapper(*args, **kwargs):
+            start = time.perf_counter()
             try:
                 return function(*args, **kwargs)
+            except (ThrottledException, NoSearchResultsException):
+                # throttling and a results page without results are not failures of the function,
+                # callers back off and retry the unit, or end the period
+                raise
             except:
-                message = f"EXCEPTION in: {function.__name__}\nERROR: {self.error}"
+                elapsed = time.perf_counter() - start
+                METRICS.inc('errors_total', function=function.__name__, error=self.error.__name__)
+                message = f"EXCEPTION in: {function.__name__}\nERROR: {self.error}\nELAPSED: {elapsed:.3f} s"
                 for key, value in self.info.items():
                     message += f'\n{key}: {value}'                   
-                self.LOGGER.debug(message)
+                create_logger().debug(message)
                 if self.raise_error == True:
                     raise self.error
         return wrapper
@@ -69,4 +80,44 @@ class SubmissionException(ScraperException):
         
 class GetElementException(ScraperException):
     def __init__(self, **kwargs):
-        super().__init__(**kwargs) 
\ No newline at end of file
+        super().__init__(**kwargs) 
+        
+class ArticleFetchException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class WorkerPoolException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class CacheException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class CheckpointException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class OutputWriteException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class DedupIndexException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class ThrottledException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class NoSearchResultsException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class WorkQueueException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+class ArchiveException(ScraperException):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
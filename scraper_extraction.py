@@ -0,0 +1,66 @@
+# JavaScript run in the browser through execute_script, so that everything needed from a page is
+# collected in a single WebDriver round trip instead of one call per element.
+
+
+# Returns {title, headers: [...], paragraphs: [...]} of an article page.
+# innerText is what WebElement.text returns, empty elements are left out.
+ARTICLE_SCRIPT = """
+const text = element => (element.innerText || '').replace(/\\s+/g, ' ').trim();
+const title = document.querySelector('head > title');
+return {
+    title: title ? title.textContent.trim() : '',
+    headers: Array.from(document.querySelectorAll('h1, h2, h3, h4, h5, h6'), text).filter(Boolean),
+    paragraphs: Array.from(document.querySelectorAll('p'), text).filter(Boolean),
+};
+"""
+
+
+# Returns {href, date} of one search result element (arguments[0]), or null if it has no link or date.
+SERP_ENTRY_FUNCTION = """
+const serpEntry = element => {
+    const anchor = element.querySelector('a');
+    const date = element.querySelector('.f');
+    if (!anchor || !date) {
+        return null;
+    }
+    return {href: anchor.href, date: date.textContent.split('—')[0].trim()};
+};
+"""
+
+SERP_ENTRY_SCRIPT = SERP_ENTRY_FUNCTION + """
+return serpEntry(arguments[0]);
+"""
+
+
+# Returns {matched, entries: [{href, date}, ...]} of the search result elements of the first XPath in the
+# list arguments[0] that matches anything, matched is its index (-1 if none matched).
+SERP_SCRIPT = SERP_ENTRY_FUNCTION + """
+for (let matched = 0; matched < arguments[0].length; matched++) {
+    const results = document.evaluate(arguments[0][matched], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    if (results.snapshotLength === 0) {
+        continue;
+    }
+    const entries = [];
+    for (let i = 0; i < results.snapshotLength; i++) {
+        const entry = serpEntry(results.snapshotItem(i));
+        if (entry) {
+            entries.push(entry);
+        }
+    }
+    return {matched: matched, entries: entries};
+}
+return {matched: -1, entries: []};
+"""
+
+
+# Returns {bytes, resources} the current page transferred so far, from the Performance API.
+# Blocked requests never reach the network and count 0 bytes.
+PAGE_STATS_SCRIPT = """
+const navigation = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+let bytes = navigation ? navigation.transferSize || 0 : 0;
+for (const resource of resources) {
+    bytes += resource.transferSize || 0;
+}
+return {bytes: bytes, resources: resources.length};
+"""
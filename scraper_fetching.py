@@ -0,0 +1,174 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+import scraper_exceptions as SE
+import scraper_metrics as SM
+import scraper_ratelimit as SRate
+from scraper_lazy import lazy_import
+
+
+
+requests = lazy_import('requests')
+HTTPAdapter = lazy_import('requests.adapters', 'HTTPAdapter')
+
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/87.0.4280.88 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+
+class ArticleHTMLParser(HTMLParser):
+    """Collect the same text the browser path collects: <title>, h1-h6 and <p> tags.
+    """
+    HEADER_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+    COLLECTED_TAGS = HEADER_TAGS | {'p'}
+    SKIPPED_TAGS = {'script', 'style', 'noscript', 'template'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.headers = []
+        self.paragraphs = []
+        self._in_title = False
+        self._skip_depth = 0
+        self._current_tag = None
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag in self.COLLECTED_TAGS:
+            # <p> tags are often left unclosed, a new block closes the previous one
+            self._flush()
+            self._current_tag = tag
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == 'title':
+            self._in_title = False
+        elif tag == self._current_tag:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._in_title and not self.title:
+            self.title = data.strip()
+        elif self._current_tag is not None:
+            self._buffer.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        if self._current_tag is not None:
+            text = ' '.join(''.join(self._buffer).split())
+            if text:
+                if self._current_tag == 'p':
+                    self.paragraphs.append(text)
+                else:
+                    self.headers.append(text)
+        self._current_tag = None
+        self._buffer = []
+
+
+
+class FetchedArticle:
+    """Text extracted from an article fetched over plain HTTP.
+
+    needs_browser is set when the raw HTML did not contain the article text
+    (failed request, non-HTML response or content rendered by JavaScript).
+    html is the raw HTML the text was extracted from, for archiving.
+    """
+    def __init__(self, link, title='', headers='', text='', needs_browser=False, html=None):
+        self.link = link
+        self.title = title
+        self.headers = headers
+        self.text = text
+        self.needs_browser = needs_browser
+        self.html = html
+
+    @classmethod
+    def from_html(cls, link, html):
+        parser = ArticleHTMLParser()
+        parser.feed(html)
+        parser.close()
+        return cls(link=link,
+                   title=parser.title,
+                   headers='. '.join(parser.headers),
+                   text=' '.join(parser.paragraphs),
+                   needs_browser=not parser.paragraphs,
+                   html=html,
+                   )
+
+
+
+class ArticleFetcher:
+    """Fetch article pages concurrently over a pooled HTTP session.
+
+    Requests are paced per host by the rate limiter. A throttled request (429/503) is tried again once
+    the host's backoff has passed, up to max_retries times, instead of ending up as an empty article.
+
+    Args:
+        max_concurrent_fetches (int): Maximum number of requests in flight at the same time.
+        timeout (int): Per-request timeout in seconds.
+        rate_limiter (RateLimiter): Per-host limiter, None to send requests unpaced.
+        max_retries (int): How many times a throttled request is tried again.
+    """
+    def __init__(self, max_concurrent_fetches=8, timeout=10, headers=None, rate_limiter=SRate.LIMITER, max_retries=2):
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else SRate.NoRateLimiter()
+        self.max_retries = max_retries
+        self._session = requests.Session()
+        self._session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=max_concurrent_fetches, pool_maxsize=max_concurrent_fetches)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_fetches, thread_name_prefix='article-fetch')
+
+    def _get(self, link):
+        for _ in range(self.max_retries+1):
+            with self.rate_limiter.slot(link) as host:
+                start = time.perf_counter()
+                try:
+                    with SM.METRICS.time('article_fetch'):
+                        response = self._session.get(link, timeout=self.timeout)
+                except:
+                    host.failed()
+                    raise
+            if response.status_code not in SRate.THROTTLE_STATUSES:
+                host.success(time.perf_counter() - start)
+                return response
+            host.throttled(SRate.parse_retry_after(response.headers.get('Retry-After')))
+        return response
+
+    @SE.ExceptionHandler(SE.ArticleFetchException, raise_error=False)
+    def fetch(self, link):
+        response = self._get(link)
+        if not response.ok or 'html' not in response.headers.get('Content-Type', ''):
+            return FetchedArticle(link, needs_browser=True)
+        with SM.METRICS.time('article_extraction'):
+            return FetchedArticle.from_html(link, response.text)
+
+    def fetch_many(self, links):
+        """Fetch all links concurrently.
+
+        Returns:
+            list[FetchedArticle]: One entry per link, in the same order. Entries are None if the request failed.
+        """
+        return list(self._executor.map(self.fetch, links))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._session.close()
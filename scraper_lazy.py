@@ -0,0 +1,46 @@
+import importlib
+import threading
+
+
+
+class LazyImport:
+    """Stand-in for a module (or an attribute of a module) that is only imported when first used.
+
+    Heavy dependencies such as pandas and selenium are bound at module level through LazyImport, so importing
+    the scraper modules stays cheap for worker processes and short command line invocations.
+
+    Args:
+        module_name (str): Module to import.
+        attribute (str): Attribute of the module to stand in for. None stands in for the module itself.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    target = importlib.import_module(self._module_name)
+                    if self._attribute is not None:
+                        target = getattr(target, self._attribute)
+                    self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._module_name if self._attribute is None else f'{self._module_name}.{self._attribute}'
+        return f'<LazyImport {name} ({"loaded" if self._target is not None else "not loaded"})>'
+
+
+
+def lazy_import(module_name, attribute=None):
+    return LazyImport(module_name, attribute)
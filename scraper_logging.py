@@ -1,36 +1,82 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
 from datetime import datetime
 import pathlib
 
 
 
+_LISTENER = None
+_FILE_HANDLER = None
+_LOCK = threading.Lock()
+
+
+
+def _add_handler(handler):
+    """Add a handler to the listener thread, the root logger only puts records on its queue. Called with _LOCK held."""
+    global _LISTENER
+    if _LISTENER is None:
+        log_queue = queue.SimpleQueue()
+        _LISTENER = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _LISTENER.start()
+        atexit.register(_LISTENER.stop)
+        logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        _LISTENER.handlers = _LISTENER.handlers + (handler,)
+
+
 def create_logger():
     """
     Creates a logging object and returns it
+
+    The log file handler is only set up by the first call, later calls return the same logger.
+    Records are passed through a queue to a background thread that writes the log file,
+    so logging calls never wait for disk I/O.
     """
+    global _FILE_HANDLER
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    # create the logging file handler
-    script_location = pathlib.Path().absolute()
-    date_time = datetime.now()
-    date_time = datetime.strftime(datetime.now(), '%Y-%m-%d_%H-%M-%S')
-    fh = logging.FileHandler(f"{script_location}\\scraper_log_{date_time}.log")
-    fmt = '\n\
+    if _FILE_HANDLER is not None:
+        return logger
+    with _LOCK:
+        if _FILE_HANDLER is None:
+            logger.setLevel(logging.DEBUG)
+            # create the logging file handler, the file is only created when the first record is written
+            script_location = pathlib.Path().absolute()
+            date_time = datetime.strftime(datetime.now(), '%Y-%m-%d_%H-%M-%S')
+            fh = logging.FileHandler(script_location / f"scraper_log_{date_time}.log", delay=True)
+            fmt = '\n\
 **********************************************\n\
 %(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    formatter = logging.Formatter(fmt)
-    fh.setFormatter(formatter)
-    # add handler to logger object
-    logger.addHandler(fh)
+            formatter = logging.Formatter(fmt)
+            fh.setFormatter(formatter)
+            _add_handler(fh)
+            _FILE_HANDLER = fh
     return logger
 
 
+def add_console_handler(level=logging.INFO, stream=None):
+    """Print log records of at least level to stream (default sys.stderr).
+
+    The console handler runs in the same listener thread as the log file handler,
+    so console output does not block the logging threads either.
+    """
+    console = logging.StreamHandler(stream)
+    console.setLevel(level)
+    logger = logging.getLogger()
+    with _LOCK:
+        if logger.getEffectiveLevel() > level:
+            logger.setLevel(level)
+        _add_handler(console)
+
+
 
 class LoggingDict():
     logging_dict = {}
-    
+
     def __init__(self, **kwargs):
         self.logging_dict.update(kwargs)
 
     def __getitem__(self, key):
-        return self.logging_dict[key]
\ No newline at end of file
+        return self.logging_dict[key]
@@ -0,0 +1,183 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, plus the most recent samples for percentiles."""
+    def __init__(self, buckets=DEFAULT_BUCKETS, reservoir_size=2048):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=reservoir_size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self._recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, percent):
+        if not self._recent:
+            return 0.0
+        values = sorted(self._recent)
+        return values[min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)]
+
+    def snapshot(self):
+        return {'count': self.count,
+                'sum_s': round(self.sum, 6),
+                'p50_ms': round(self.percentile(50) * 1000, 3),
+                'p90_ms': round(self.percentile(90) * 1000, 3),
+                'p99_ms': round(self.percentile(99) * 1000, 3),
+                }
+
+
+
+class MetricsRegistry:
+    """Counters and per-stage latency histograms of a scrape run.
+
+    The scraper times the stages navigation, date_range, serp_parse, article_fetch, article_extraction
+    (parsing one article), serp_extraction (truncating all articles of a results page) and write.
+
+    Snapshots are available as a dict / JSON (snapshot, to_json) and in the Prometheus text format (to_prometheus).
+    """
+    PREFIX = 'scraper'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._counters = {}
+            self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            if stage not in self._histograms:
+                self._histograms[stage] = Histogram()
+            self._histograms[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator timing every call of the function as the stage."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ','.join(f'{key}={label_value}' for key, label_value in labels)
+                counters[f'{name}{{{label_text}}}' if label_text else name] = value
+            return {'uptime_s': round(time.time() - self.started_at, 3),
+                    'counters': counters,
+                    'stages': {stage: histogram.snapshot() for stage, histogram in self._histograms.items()},
+                    }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ','.join(f'{key}="{label_value}"' for key, label_value in labels)
+                lines.append(f'{self.PREFIX}_{name}{{{label_text}}} {value}' if label_text else f'{self.PREFIX}_{name} {value}')
+            name = f'{self.PREFIX}_stage_duration_seconds'
+            if self._histograms:
+                lines.append(f'# TYPE {name} histogram')
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+
+# registry shared by all scrapers of the process
+METRICS = MetricsRegistry()
+
+
+
+class MetricsFileWriter(threading.Thread):
+    """Periodically write a metrics snapshot to a file.
+
+    Files ending in .prom are written in the Prometheus text format (e.g. for the node exporter
+    textfile collector), any other file as JSON.
+
+    Args:
+        path (str): File the snapshot is written to.
+        interval (float): Seconds between snapshots.
+        registry (MetricsRegistry): Registry to snapshot.
+    """
+    def __init__(self, path, interval=30, registry=METRICS):
+        super().__init__(name='metrics-writer', daemon=True)
+        self.path = Path(path)
+        self.interval = interval
+        self.registry = registry
+        self._stop_event = threading.Event()
+
+    def write(self):
+        text = self.registry.to_prometheus() if self.path.suffix == '.prom' else self.registry.to_json()
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        temp_path.write_text(text, encoding='utf-8')
+        temp_path.replace(self.path)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try: self.write()
+            except OSError: pass
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        # a failed final snapshot must not replace the result or the exception of the scrape
+        try: self.write()
+        except OSError as e: LOGGER.warning(f'Metrics file {self.path} not written: {e}')
@@ -0,0 +1,172 @@
+import collections
+import datetime
+import logging
+import math
+
+import scraper_metrics as SM
+from scraper_lazy import lazy_import
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+pd = lazy_import('pandas')
+
+
+
+def period_days(period):
+    """Number of days of an inclusive (from, to) period."""
+    from_d, to_d = period
+    return (to_d - from_d).days + 1
+
+
+def split_period(period, parts):
+    """Split an inclusive (from, to) period into up to parts consecutive periods of (nearly) equal length."""
+    from_d, to_d = period
+    days = period_days(period)
+    parts = max(min(parts, days), 1)
+    periods = []
+    for part in range(parts):
+        start = from_d + datetime.timedelta(days=days * part // parts)
+        end = from_d + datetime.timedelta(days=days * (part+1) // parts - 1)
+        periods.append((start, end))
+    return periods
+
+
+
+class PeriodPlanner:
+    """Plan search periods from the results the periods before them returned.
+
+    Planning starts from the fixed grid of GoogleScraper.generate_date_ranges. The density of the search
+    (results per day) is estimated from every scraped period and decides the next one: consecutive grid periods
+    are merged while the estimate says they fit into fill of the results pages, so sparse stretches cost a single
+    search, and a grid period expected to overflow the results pages is split before it is searched. A period
+    that still saturates the results pages (its last page is full, so results were cut off) is split in two and
+    the halves are searched right after it. A period without any results counts as density 0, so empty stretches
+    are merged as far as max_merged_periods allows.
+
+    Periods are numbered in the order they are planned, self.periods[period_no-1] is the (from, to) of a period.
+
+    Args:
+        grid (list[tuple]): (from, to) periods of generate_date_ranges.
+        capacity (int): Results the results pages of one period hold.
+        fill (float): Share of capacity a planned period is expected to return.
+        max_merged_periods (int): Most grid periods merged into one period.
+        smoothing (float): Weight of the latest period in the density estimate.
+    """
+    def __init__(self, grid, capacity, fill=0.6, max_merged_periods=8, smoothing=0.5):
+        self.capacity = capacity
+        self.fill = fill
+        self.max_merged_periods = max_merged_periods
+        self.smoothing = smoothing
+        self.periods = []
+        # {period_no: number of the saturated period it is a half of}
+        self.parents = {}
+        self.density = None
+        self._merged = 1
+        self._grid = collections.deque(grid)
+        self._pending = collections.deque()
+
+    def _plan(self, period):
+        self.periods.append(period)
+        return len(self.periods)
+
+    def _expected(self, days):
+        return self.density * days if self.density is not None else None
+
+    def next_period(self):
+        """Number of the next period to search, None once the grid is covered."""
+        if self._pending:
+            return self._pending.popleft()
+        if not self._grid:
+            return None
+
+        from_d, to_d = self._grid.popleft()
+        target = self.capacity * self.fill
+        expected = self._expected(period_days((from_d, to_d)))
+        if expected is not None and expected > self.capacity:
+            parts = split_period((from_d, to_d), math.ceil(expected / target))
+            if len(parts) > 1:
+                LOGGER.info(f'Period {from_d:%Y-%m-%d} to {to_d:%Y-%m-%d} expects {expected:.0f} results, split into {len(parts)}')
+                SM.METRICS.inc('periods_split_total', len(parts)-1)
+                planned = [self._plan(part) for part in parts]
+                self._pending.extend(planned[1:])
+                return planned[0]
+
+        # merging grows at most twice as fast as the grid periods merged last time, so a single sparse
+        # period does not make the next search run deep into a dense stretch
+        merged = 1
+        while self._grid and merged < min(self.max_merged_periods, 2 * self._merged):
+            expected = self._expected(period_days((from_d, self._grid[0][1])))
+            if expected is None or expected > target:
+                break
+            to_d = self._grid.popleft()[1]
+            merged += 1
+        self._merged = merged
+        if merged > 1:
+            LOGGER.info(f'Sparse periods {from_d:%Y-%m-%d} to {to_d:%Y-%m-%d} merged from {merged} grid periods')
+            SM.METRICS.inc('periods_merged_total', merged-1)
+        return self._plan((from_d, to_d))
+
+    def _observe(self, observed, saturated=False):
+        if saturated:
+            # results were cut off, the true density is higher than observed
+            observed *= 2
+        self.density = observed if self.density is None else self.smoothing * observed + (1 - self.smoothing) * self.density
+        if saturated:
+            self.density = max(self.density, observed)
+
+    def record(self, period_no, results, saturated):
+        """Update the density estimate with a searched period, split it if it saturated the results pages.
+
+        Args:
+            period_no (int): Number of the searched period.
+            results (int): Search results its results pages listed.
+            saturated (bool): Its last results page was full.
+
+        Returns:
+            list[int]: Numbers of the periods the saturated period was split into, searched next.
+        """
+        period = self.periods[period_no-1]
+        days = period_days(period)
+        self._observe(results / days, saturated)
+        if not saturated or days == 1:
+            return []
+        # a period recorded again after a resume was already split before the interruption
+        halves = [half for half, parent in self.parents.items() if parent == period_no]
+        if halves:
+            return halves
+
+        halves = [self._plan(part) for part in split_period(period, 2)]
+        self.parents.update((half, period_no) for half in halves)
+        LOGGER.info(f'Period {period_no} ({period[0]:%Y-%m-%d} to {period[1]:%Y-%m-%d}) saturated the results pages, '
+                    f'searching it again as periods {halves}')
+        SM.METRICS.inc('periods_split_total')
+        self._pending.extendleft(reversed(halves))
+        return halves
+
+    def restore(self, periods, done_periods, period_results, parents=None, saturated_periods=()):
+        """Continue the plan of an interrupted run.
+
+        The density estimate is rebuilt by replaying the searched periods in the order they were finished,
+        so the resumed plan continues the way the interrupted run would have.
+
+        Args:
+            periods (dict): {period_no: (from, to)} of the periods planned so far.
+            done_periods (set[int]): Numbers of the periods that were fully searched.
+            period_results (dict): {period_no: results} of the searched periods, in the order they were finished.
+            parents (dict): {period_no: saturated period_no} of the planned halves of saturated periods.
+            saturated_periods (set[int]): Numbers of the searched periods that saturated the results pages.
+        """
+        self.parents.update(parents or {})
+        for period_no in sorted(periods):
+            from_d, to_d = periods[period_no]
+            self._plan((pd.Timestamp(from_d), pd.Timestamp(to_d)))
+            if period_no not in done_periods:
+                self._pending.append(period_no)
+        if self.periods:
+            planned_to = max(to_d for _, to_d in self.periods)
+            while self._grid and self._grid[0][1] <= planned_to:
+                self._grid.popleft()
+        for period_no, results in period_results.items():
+            self._observe(results / period_days(self.periods[period_no-1]), period_no in saturated_periods)
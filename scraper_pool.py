@@ -0,0 +1,367 @@
+import heapq
+import logging
+import queue
+import threading
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from pathlib import Path
+
+import scraper_checkpoint as SCheckpoint
+import scraper_classes as SC
+import scraper_exceptions as SE
+import scraper_metrics as SM
+import scraper_sinks as SSinks
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+PageUnit = namedtuple('PageUnit', ['period', 'page'])
+
+
+
+class SearchProgress:
+    """Journal, sinks and pending (period, page) units of one keyword search scraped by several workers.
+
+    The units are recorded one by one by the thread that collects the workers' results. A period is
+    closed and journaled as done once all its units are recorded.
+
+    Args:
+        job_id (int): Number of the search among the searches scraped together.
+        scraper_kwargs (dict): Arguments the search's GoogleScrapers are created with.
+    """
+    def __init__(self, job_id, scraper_kwargs):
+        self.job_id = job_id
+        self.scraper_kwargs = scraper_kwargs
+        self.keyword = scraper_kwargs['keyword']
+        self.save_to_location = Path(scraper_kwargs['save_to_location'])
+        self.google_results_pages = scraper_kwargs.get('google_results_pages', 5)
+        self.search_periods = SC.GoogleScraper.generate_date_ranges(scraper_kwargs['search_start_date'],
+                                                                    scraper_kwargs['periods'],
+                                                                    scraper_kwargs.get('periodicity', 'M'))
+        self.sinks = None
+        self.journal = None
+        self.pending = {}
+        self.attempts = {}
+        self.last_pages = {}
+        self.pages_done = 0
+        self.pages_total = 0
+        self.articles = 0
+        self._lock = threading.Lock()
+
+    def open(self, sinks=None):
+        """Open the search's journal and sinks and return the units still to scrape."""
+        resume = self.scraper_kwargs.get('resume', False)
+        self.save_to_location.mkdir(parents=True, exist_ok=True)
+        self.sinks = sinks if sinks is not None else [SSinks.CSVSink(self.save_to_location, append=resume)]
+        self.journal = SCheckpoint.RunJournal(SCheckpoint.journal_path(self.save_to_location, self.keyword, self.search_periods),
+                                              resume=resume)
+        self.last_pages.update(self.journal.last_pages)
+        units = []
+        for period_no in range(1, len(self.search_periods)+1):
+            if self.journal.is_period_done(period_no):
+                continue
+            self.pending[period_no] = set()
+            for page_no in range(1, self.google_results_pages+1):
+                if self.journal.is_page_done(period_no, page_no) or self.journal.is_past_last_page(period_no, page_no):
+                    continue
+                self.pending[period_no].add(page_no)
+                units.append(PageUnit(period_no, page_no))
+            if not self.pending[period_no]:
+                # nothing left to scrape, only the period output needs closing
+                self.pending[period_no].add(0)
+                units.append(PageUnit(period_no, 0))
+        self.pages_total = len(units)
+        return units
+
+    def period_dates(self, period_no):
+        from_d, to_d = self.search_periods[period_no-1]
+        return from_d.strftime('%m/%d/%Y'), to_d.strftime('%m/%d/%Y')
+
+    def past_last_page(self, period_no, page_no):
+        with self._lock:
+            return page_no > self.last_pages.get(period_no, self.google_results_pages)
+
+    def set_last_page(self, period_no, page_no):
+        with self._lock:
+            self.last_pages[period_no] = min(page_no, self.last_pages.get(period_no, self.google_results_pages))
+            self.journal.set_last_page(period_no, self.last_pages[period_no])
+
+    def add_attempt(self, unit):
+        with self._lock:
+            self.attempts[unit] = self.attempts.get(unit, 0) + 1
+            return self.attempts[unit]
+
+    def record(self, unit, articles):
+        """Journal a finished unit, and close its period once it was the period's last pending unit.
+
+        Args:
+            unit (PageUnit): The finished unit.
+            articles (list[ArticleRecord]): Articles of the unit, None if it was given up.
+        """
+        self.pending[unit.period].discard(unit.page)
+        self.pages_done += 1
+        # pages that were given up on are not journaled, a resumed run tries them again
+        if articles is None:
+            articles = []
+        elif unit.page > 0:
+            for sink in self.sinks:
+                sink.flush()
+            self.journal.links_done(unit.period, unit.page, [article['link'] for article in articles])
+            self.journal.page_done(unit.period, unit.page)
+        self.articles += len(articles)
+        LOGGER.info(f'[{self.keyword}] period {unit.period}, page {unit.page} done: {len(articles)} articles '
+                    f'({self.pages_done}/{self.pages_total} pages)')
+
+        if not self.pending[unit.period]:
+            from_d, to_d = self.period_dates(unit.period)
+            for sink in self.sinks:
+                sink.close_period(self.keyword, from_d, to_d)
+            if self.scraper_kwargs.get('dedup_index') is not None:
+                self.scraper_kwargs['dedup_index'].save()
+            self.journal.period_done(unit.period)
+            SM.METRICS.inc('periods_total')
+            del self.pending[unit.period]
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def close(self):
+        for sink in self.sinks or []:
+            sink.close()
+        if self.journal is not None:
+            self.journal.close()
+
+
+
+class FairScheduler:
+    """Hand out units of work round-robin over the searches that still have units queued.
+
+    A long search therefore cannot starve short ones: every search gets the next free worker in turn, and each
+    search's own units are handed out in (period, page) order.
+    """
+    def __init__(self):
+        self._queues = {}
+        self._turns = deque()
+        self._condition = threading.Condition()
+
+    def put(self, search, unit):
+        with self._condition:
+            if search.job_id not in self._queues:
+                self._queues[search.job_id] = (search, [])
+            heapq.heappush(self._queues[search.job_id][1], unit)
+            if search.job_id not in self._turns:
+                self._turns.append(search.job_id)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Return the next (search, unit), raises queue.Empty if nothing was queued within timeout."""
+        with self._condition:
+            if not self._turns and not self._condition.wait_for(lambda: self._turns, timeout):
+                raise queue.Empty
+            job_id = self._turns.popleft()
+            search, units = self._queues[job_id]
+            unit = heapq.heappop(units)
+            if units:
+                self._turns.append(job_id)
+            return search, unit
+
+
+
+class UnitQueue(ABC):
+    """Where workers take (period, page) units of work from and hand them back to, see run_unit."""
+
+    @abstractmethod
+    def requeue(self, search, unit, count_attempt=True):
+        """Hand the unit out again, or give it up once it failed too often."""
+
+    @abstractmethod
+    def end_period(self, search, unit, last_page):
+        """The unit's period has no results pages after last_page, the unit is done without articles."""
+
+    @abstractmethod
+    def complete(self, search, unit, articles):
+        """The unit was scraped, articles are the ArticleRecords of its results page."""
+
+
+
+def run_unit(units, search, unit, scraper, browser_alive):
+    """Scrape a (period, page) unit of work and hand it back to the queue it came from.
+
+    A results page without search results ends its period (before page 1 for a period without any results),
+    so does a later results page that fails while the browser is fine. A throttled unit is requeued without
+    counting as a failed attempt, any other failure counts.
+
+    Args:
+        units (UnitQueue): Queue the unit was taken from.
+        search: Search the unit belongs to, passed back to units.
+        unit: The unit, unit.period and unit.page are its period and results page numbers.
+        scraper (GoogleScraper): The worker's scraper of the search.
+        browser_alive (callable): Tells whether the worker's browser still runs.
+
+    Returns:
+        bool: False if the browser died, the worker restarts it before its next unit.
+    """
+    try:
+        articles = scraper.scrape_results_page(unit.period, unit.page)
+    except SE.ThrottledException:
+        # the rate limiter backs off, the unit is tried again without counting as a failed attempt
+        SM.METRICS.inc('units_requeued_total', reason='throttled')
+        units.requeue(search, unit, count_attempt=False)
+        return True
+    except SE.NoSearchResultsException:
+        units.end_period(search, unit, unit.page-1)
+        return True
+    except Exception:
+        if not browser_alive():
+            LOGGER.debug(f'{threading.current_thread().name} lost its browser, restarting it')
+            SM.METRICS.inc('browser_restarts_total')
+            units.requeue(search, unit)
+            return False
+        if unit.page > 1:
+            # the browser is fine, the period simply has no such results page
+            units.end_period(search, unit, unit.page-1)
+        else:
+            units.requeue(search, unit)
+        return True
+    units.complete(search, unit, articles)
+    return True
+
+
+
+class LocalUnitQueue(UnitQueue):
+    """Units of the searches scraped by the worker threads of this process.
+
+    A FairScheduler hands the units out. Finished units are collected in self.results as (search, unit, articles)
+    for the thread recording them, articles is None for a unit that was given up after max_attempts.
+
+    Args:
+        max_attempts (int): How many times a unit is tried before it is given up as empty.
+    """
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+        self.results = queue.Queue()
+        self._scheduler = FairScheduler()
+
+    def put(self, search, unit):
+        self._scheduler.put(search, unit)
+
+    def get(self, timeout=None):
+        """Return the next (search, unit) to scrape, raises queue.Empty if nothing was queued within timeout.
+
+        Units that only close their period, or are past the last results page of their period, are done without scraping.
+        """
+        while True:
+            search, unit = self._scheduler.get(timeout)
+            if unit.page > 0 and not search.past_last_page(unit.period, unit.page):
+                return search, unit
+            self.results.put((search, unit, []))
+
+    def requeue(self, search, unit, count_attempt=True):
+        if count_attempt:
+            attempts = search.add_attempt(unit)
+            if attempts >= self.max_attempts:
+                LOGGER.debug(f'Giving up on [{search.keyword}] period {unit.period}, page {unit.page} after {attempts} attempts')
+                SM.METRICS.inc('units_given_up_total')
+                self.results.put((search, unit, None))
+                return
+        self._scheduler.put(search, unit)
+
+    def end_period(self, search, unit, last_page):
+        search.set_last_page(unit.period, last_page)
+        self.results.put((search, unit, []))
+
+    def complete(self, search, unit, articles):
+        self.results.put((search, unit, articles))
+
+
+
+class ScraperPool:
+    """Scrape Google Search with several browsers at once.
+
+    Every worker thread owns its own GoogleScraper (and therefore its own Chrome process) and pulls
+    (period, page) units of work from a shared LocalUnitQueue. All workers stream their articles into the same
+    sinks (by default the per-period CSV files GoogleScraper.scrape produces) and progress is journaled like
+    in GoogleScraper.scrape, so resume=True continues an interrupted pool run as well. A worker whose browser crashes restarts it
+    and its unit is handed to the next free worker, so a single broken Chrome does not stop the run.
+
+    Args:
+        workers (int): Number of browser workers.
+        max_attempts (int): How many times a unit is tried before it is given up as empty.
+        max_browser_starts (int): How many browser starts in a row may fail before a worker stops.
+        **scraper_kwargs: Arguments every worker passes to GoogleScraper.
+    """
+    def __init__(self, workers=2, max_attempts=3, max_browser_starts=3, **scraper_kwargs):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_browser_starts = max_browser_starts
+        self.scraper_kwargs = scraper_kwargs
+        self.search = SearchProgress(1, scraper_kwargs)
+        self.keyword = self.search.keyword
+        self.save_to_location = scraper_kwargs['save_to_location']
+        self.google_results_pages = self.search.google_results_pages
+        self.search_periods = self.search.search_periods
+        # the sinks are created once and shared by all workers
+        self.sinks = scraper_kwargs.setdefault('sinks', [SSinks.CSVSink(self.save_to_location, append=scraper_kwargs.get('resume', False))])
+        self._units = LocalUnitQueue(max_attempts)
+        self._stop = threading.Event()
+
+
+    def _start_scraper(self):
+        for _ in range(self.max_browser_starts):
+            try:
+                scraper = SC.GoogleScraper(**self.scraper_kwargs)
+                # links journaled before an interruption are skipped by the workers
+                scraper.journal = self.search.journal
+                return scraper
+            except Exception:
+                LOGGER.debug(f'{threading.current_thread().name} failed to start a browser')
+        return None
+
+
+    def _worker(self):
+        scraper = None
+        while not self._stop.is_set():
+            try: search, unit = self._units.get(timeout=0.5)
+            except queue.Empty: continue
+
+            if scraper is None:
+                scraper = self._start_scraper()
+                if scraper is None:
+                    self._units.requeue(search, unit, count_attempt=False)
+                    break
+
+            if not run_unit(self._units, search, unit, scraper, scraper.session.alive):
+                scraper.close()
+                scraper = None
+
+        if scraper is not None:
+            scraper.close()
+
+
+    def scrape(self):
+        """Scrape all search periods and save one CSV file per period to the save location.
+        """
+        for unit in self.search.open(self.sinks):
+            self._units.put(self.search, unit)
+
+        threads = [threading.Thread(target=self._worker, name=f'scraper-worker-{i}', daemon=True)
+                   for i in range(1, self.workers+1)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not self.search.done:
+                try:
+                    search, unit, articles = self._units.results.get(timeout=1)
+                except queue.Empty:
+                    if not any(thread.is_alive() for thread in threads):
+                        raise SE.WorkerPoolException()
+                    continue
+                search.record(unit, articles)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.search.close()
@@ -0,0 +1,70 @@
+COLUMNS = ['title', 'headers', 'text', 'date', 'link']
+
+
+
+class ArticleRecord:
+    """Compact article record produced by process_batch.
+
+    Fields can be read as attributes or by key (record['text']).
+    """
+    __slots__ = ('title', 'headers', 'text', 'date', 'link', 'header_word_count', 'text_word_count')
+
+    def __init__(self, title, headers, text, date, link, header_word_count, text_word_count):
+        self.title = title
+        self.headers = headers
+        self.text = text
+        self.date = date
+        self.link = link
+        self.header_word_count = header_word_count
+        self.text_word_count = text_word_count
+
+    def __getitem__(self, key):
+        try: return getattr(self, key)
+        except AttributeError: raise KeyError(key)
+
+    @property
+    def word_count(self):
+        return self.text_word_count
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in COLUMNS}
+
+    def __repr__(self):
+        return f'ArticleRecord(title={self.title!r}, date={self.date!r}, link={self.link!r})'
+
+
+
+def truncate_words(string, max_words):
+    """Collapse whitespace (including newlines) and keep the first max_words words.
+
+    Returns:
+        tuple(str, int): The truncated string and its word count.
+    """
+    if max_words <= 0:
+        return '', 0
+    # the rest of the string after max_words words stays in one piece and is dropped
+    words = string.split(None, max_words)[:max_words]
+    return ' '.join(words), len(words)
+
+
+def process_batch(raw_articles, max_header_word_count=20, max_text_word_count=400):
+    """Normalize, truncate and count the words of a batch of articles.
+
+    Every field is split once, with plain string operations: a results page holds about ten articles,
+    too few for the setup of a vectorized (DataFrame) pass to pay off.
+
+    Args:
+        raw_articles (list[tuple]): (title, headers, text, date, link) of every article.
+        max_header_word_count (int): Number of words headers are truncated to.
+        max_text_word_count (int): Number of words text is truncated to.
+
+    Returns:
+        list[ArticleRecord]: One record per article, in the same order.
+    """
+    records = []
+    for title, headers, text, date, link in raw_articles:
+        title = ' '.join((title or '').split())
+        headers, header_word_count = truncate_words(headers or '', max_header_word_count)
+        text, text_word_count = truncate_words(text or '', max_text_word_count)
+        records.append(ArticleRecord(title, headers, text, date, link, header_word_count, text_word_count))
+    return records
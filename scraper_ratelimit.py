@@ -0,0 +1,190 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import scraper_metrics as SM
+
+
+
+# response statuses that mean the host wants us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+# search navigation is paced much slower than article fetching, Google answers bursts with its /sorry/ page
+DEFAULT_HOST_LIMITS = {
+    'www.google.com': {'rate': 0.5, 'burst': 2, 'max_rate': 1.0, 'max_concurrency': 4},
+}
+
+
+
+class TokenBucket:
+    """Token bucket handing out reservations.
+
+    A reservation takes a token right away, even if the bucket is empty, and returns how long the caller
+    has to wait for it. Callers therefore sleep outside of the lock and are served in the order they came.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0.0)
+
+
+
+class HostLimiter:
+    """Pace the requests to one host with a token bucket and a cap on concurrent requests.
+
+    The rate adapts AIMD style: every fast successful response adds increase requests/s up to max_rate,
+    a throttled (429/503 or Google's /sorry/ page), failed or slow response multiplies the rate by
+    decrease_factor down to min_rate. Decreases are applied at most once per cooldown, so a burst of
+    responses to requests sent at the old rate only counts once. A throttled host is not contacted again
+    until its Retry-After (or backoff) has passed.
+    """
+    def __init__(self, host, rate=4.0, burst=8, max_concurrency=8, min_rate=0.05, max_rate=None, increase=0.1,
+                 decrease_factor=0.5, cooldown=2.0, slow_threshold=5.0, backoff=5.0, max_backoff=120.0):
+        self.host = host
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.slow_threshold = slow_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked_until = 0.0
+        self.throttled_count = 0
+        self._last_decrease = 0.0
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.bucket.reserve(now), self.blocked_until - now)
+        if wait > 0:
+            with SM.METRICS.time('rate_limit_wait'):
+                time.sleep(wait)
+
+    def release(self):
+        self._semaphore.release()
+
+    def _decrease(self, now):
+        if now - self._last_decrease >= self.cooldown:
+            self.bucket.rate = max(self.bucket.rate * self.decrease_factor, self.min_rate)
+            self._last_decrease = now
+
+    def success(self, elapsed):
+        with self._lock:
+            if elapsed > self.slow_threshold:
+                self._decrease(time.monotonic())
+            else:
+                self.bucket.rate = min(self.bucket.rate + self.increase, self.max_rate)
+
+    def failed(self):
+        with self._lock:
+            self._decrease(time.monotonic())
+
+    def throttled(self, retry_after=None):
+        now = time.monotonic()
+        with self._lock:
+            self._decrease(now)
+            self.throttled_count += 1
+            delay = min(retry_after if retry_after is not None else self.backoff, self.max_backoff)
+            self.blocked_until = max(self.blocked_until, now + delay)
+        SM.METRICS.inc('throttled_total', host=self.host)
+
+    def stats(self):
+        return {'rate': round(self.rate, 3), 'throttled': self.throttled_count}
+
+
+
+class RateLimiter:
+    """Per-host rate limiting of search navigation and article fetching.
+
+    with limiter.slot(url) as host:
+        response = session.get(url)
+    host.success(elapsed)  # or host.failed() / host.throttled(retry_after)
+
+    Args:
+        rate (float): Starting requests per second of a host.
+        burst (int): Requests a host may get at once after being idle.
+        max_concurrency (int): Requests in flight to a host at the same time.
+        host_limits (dict): HostLimiter arguments of specific hosts, overriding the ones above.
+        **limiter_kwargs: Further HostLimiter arguments of every host.
+    """
+    def __init__(self, rate=4.0, burst=8, max_concurrency=8, host_limits=DEFAULT_HOST_LIMITS, **limiter_kwargs):
+        self.defaults = dict(limiter_kwargs, rate=rate, burst=burst, max_concurrency=max_concurrency)
+        self.host_limits = host_limits or {}
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url):
+        host = (urlsplit(url).hostname or '').lower()
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._hosts.get(host)
+                if limiter is None:
+                    limiter = HostLimiter(host, **dict(self.defaults, **self.host_limits.get(host, {})))
+                    self._hosts[host] = limiter
+        return limiter
+
+    @contextmanager
+    def slot(self, url):
+        limiter = self.host(url)
+        limiter.acquire()
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    def stats(self):
+        with self._lock:
+            return {host: limiter.stats() for host, limiter in self._hosts.items()}
+
+
+
+class _UnlimitedHost:
+    def success(self, elapsed): pass
+    def failed(self): pass
+    def throttled(self, retry_after=None): pass
+
+
+
+class NoRateLimiter:
+    """Stand-in for RateLimiter that never waits, used when rate limiting is turned off."""
+    _host = _UnlimitedHost()
+
+    def host(self, url):
+        return self._host
+
+    @contextmanager
+    def slot(self, url):
+        yield self._host
+
+    def stats(self):
+        return {}
+
+
+
+def parse_retry_after(value):
+    """Seconds of a Retry-After header given in seconds, None if missing or given as a date."""
+    try: return max(float(value), 0.0)
+    except (TypeError, ValueError): return None
+
+
+
+# limiter shared by all scrapers of the process, so pooled and batched workers are paced together
+LIMITER = RateLimiter()
@@ -0,0 +1,76 @@
+import logging
+import threading
+
+import scraper_metrics as SM
+from scraper_lazy import lazy_import
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+By = lazy_import('selenium.webdriver.common.by', 'By')
+WebDriverWait = lazy_import('selenium.webdriver.support.ui', 'WebDriverWait')
+EC = lazy_import('selenium.webdriver.support.expected_conditions')
+selenium_exceptions = lazy_import('selenium.common.exceptions')
+
+
+
+class SelectorStrategy:
+    """Find out which of several candidate XPaths a page layout uses, waiting only once.
+
+    The page is waited for on the union of all candidates, so whichever layout is served is found as soon as
+    it appears instead of after the timeouts of the candidates before it. Which candidate actually matched is
+    decided in the browser in a single script call (see scraper_extraction.SERP_SCRIPT), trying the candidate
+    that matched last time first. Hits per candidate are counted, a change of the winning candidate is logged
+    as a likely layout change.
+
+    Args:
+        name (str): Name of the selector, used in logs and metrics.
+        candidates (list[str]): XPaths in order of preference.
+    """
+    def __init__(self, name, candidates):
+        self.name = name
+        self.candidates = list(candidates)
+        self.union = ' | '.join(self.candidates)
+        self.winner = None
+        self.hits = {xpath: 0 for xpath in self.candidates}
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def ordered(self):
+        """Candidates in the order they are tried: the last winner first, then the rest in order of preference."""
+        with self._lock:
+            winner = self.winner
+        if winner is None:
+            return list(self.candidates)
+        return [winner] + [xpath for xpath in self.candidates if xpath != winner]
+
+    def wait(self, browser, wait_sec=5):
+        """Wait until any candidate matches. Returns False if none did within wait_sec."""
+        try:
+            WebDriverWait(browser, wait_sec).until(EC.presence_of_element_located((By.XPATH, self.union)))
+            return True
+        except selenium_exceptions.TimeoutException:
+            return False
+
+    def record(self, xpath):
+        """Count a match of xpath, or a miss if xpath is None."""
+        with self._lock:
+            if xpath is None:
+                self.misses += 1
+            else:
+                self.hits[xpath] += 1
+                previous, self.winner = self.winner, xpath
+        if xpath is None:
+            SM.METRICS.inc('selector_misses_total', selector=self.name)
+            return
+        SM.METRICS.inc('selector_hits_total', selector=self.name, candidate=self.candidates.index(xpath))
+        if previous is not None and previous != xpath:
+            LOGGER.warning(f'Selector {self.name}: layout changed, now matching {xpath} instead of {previous}')
+
+    def stats(self):
+        with self._lock:
+            return {'winner': self.winner,
+                    'hits': dict(self.hits),
+                    'misses': self.misses,
+                    }
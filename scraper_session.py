@@ -0,0 +1,453 @@
+import functools
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import scraper_exceptions as SE
+import scraper_metrics as SM
+from scraper_lazy import lazy_import
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+ChromeDriverManager = lazy_import('webdriver_manager.chrome', 'ChromeDriverManager')
+Chrome = lazy_import('selenium.webdriver', 'Chrome')
+ChromeOptions = lazy_import('selenium.webdriver', 'ChromeOptions')
+
+
+
+class BrowserProfile:
+    """Chrome settings of a browser session.
+
+    Resource types are blocked through URL patterns (Chrome's Network.setBlockedURLs), images additionally through
+    Chrome's content settings so that images without a file extension are not loaded either.
+
+    Args:
+        name (str): Name of the profile, used as metrics label.
+        blocked_resource_types (tuple[str]): Resource types not loaded, of RESOURCE_TYPE_PATTERNS.
+        blocked_url_patterns (tuple[str]): Further URL patterns not loaded (ads, trackers, ...), * is a wildcard.
+        page_load_strategy (str): 'normal' waits for the load event, 'eager' only for the DOM (DOMContentLoaded).
+        page_load_timeout (float): Seconds after which loading a page is stopped and the page is used as far as it loaded, None for no limit.
+    """
+    RESOURCE_TYPE_PATTERNS = {
+        'image': ('*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp', '*.avif'),
+        'font': ('*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'),
+        'media': ('*.mp4', '*.webm', '*.m3u8', '*.ts', '*.mp3', '*.m4a', '*.ogg', '*.wav'),
+        'stylesheet': ('*.css',),
+    }
+
+    def __init__(self, name, blocked_resource_types=(), blocked_url_patterns=(), page_load_strategy='normal', page_load_timeout=None):
+        self.name = name
+        self.blocked_resource_types = tuple(blocked_resource_types)
+        self.blocked_url_patterns = tuple(blocked_url_patterns)
+        self.page_load_strategy = page_load_strategy
+        self.page_load_timeout = page_load_timeout
+
+    @property
+    def blocked_urls(self):
+        patterns = [pattern for resource_type in self.blocked_resource_types for pattern in self.RESOURCE_TYPE_PATTERNS[resource_type]]
+        return patterns + list(self.blocked_url_patterns)
+
+    def __repr__(self):
+        return f'BrowserProfile({self.name!r})'
+
+
+# third party ads, trackers and embeds that never hold article text
+THIRD_PARTY_URL_PATTERNS = (
+    '*doubleclick.net*', '*googlesyndication.com*', '*googletagmanager.com*', '*googletagservices.com*',
+    '*google-analytics.com*', '*adservice.google.*', '*amazon-adsystem.com*', '*facebook.net*',
+    '*connect.facebook.com*', '*scorecardresearch.com*', '*taboola.com*', '*outbrain.com*', '*criteo.*',
+    '*chartbeat.*', '*hotjar.com*', '*quantserve.com*', '*youtube.com/embed*', '*platform.twitter.com*', '*/ads/*',
+)
+
+PROFILES = {
+    # the settings the scraper always used: everything is loaded and pages are waited for until their load event
+    'default': BrowserProfile('default'),
+    # only the HTML and its scripts are loaded, pages are used as soon as their DOM is ready
+    'lean': BrowserProfile('lean',
+                           blocked_resource_types=('image', 'font', 'media'),
+                           blocked_url_patterns=THIRD_PARTY_URL_PATTERNS,
+                           page_load_strategy='eager',
+                           page_load_timeout=15),
+}
+
+
+def get_profile(profile):
+    """Return the BrowserProfile of a profile name in PROFILES, profiles are returned unchanged."""
+    return profile if isinstance(profile, BrowserProfile) else PROFILES[profile]
+
+
+
+DRIVER_CACHE_FILE = Path(os.environ.get('SCRAPER_DRIVER_CACHE', Path.home() / '.cache' / 'google_scraper' / 'chromedriver.json'))
+# a cached driver path is checked against webdriver_manager again after this many seconds (when online)
+DRIVER_CACHE_MAX_AGE = 7 * 24 * 3600
+
+_DRIVER_PATH = None
+_DRIVER_LOCK = threading.Lock()
+
+
+
+def _read_driver_cache(cache_file):
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            entry = json.load(f)
+        return entry['driver_path'], entry['resolved_at']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, 0
+
+
+def _write_driver_cache(cache_file, driver_path):
+    cache_file = Path(cache_file)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_file.with_name(cache_file.name + '.tmp')
+        temp_path.write_text(json.dumps({'driver_path': driver_path, 'resolved_at': time.time()}), encoding='utf-8')
+        temp_path.replace(cache_file)
+    except OSError:
+        LOGGER.debug(f'Could not write the driver cache {cache_file}')
+
+
+def resolve_driver_path(cache_file=DRIVER_CACHE_FILE, offline=None, max_age=DRIVER_CACHE_MAX_AGE):
+    """Return the path of the chromedriver binary, asking webdriver_manager at most once.
+
+    The path is kept for the rest of the process and in cache_file between processes. A cached path is
+    reused as long as the binary exists and the entry is younger than max_age.
+
+    Args:
+        cache_file (str): JSON file the resolved path is cached in.
+        offline (bool): Never contact webdriver_manager, only use the cached path. Defaults to the
+            SCRAPER_OFFLINE environment variable.
+        max_age (float): Seconds after which an online run resolves the path again.
+    """
+    global _DRIVER_PATH
+    if offline is None:
+        offline = os.environ.get('SCRAPER_OFFLINE', '') not in ('', '0')
+    if _DRIVER_PATH is not None:
+        return _DRIVER_PATH
+    with _DRIVER_LOCK:
+        if _DRIVER_PATH is not None:
+            return _DRIVER_PATH
+        driver_path, resolved_at = _read_driver_cache(cache_file)
+        cache_valid = driver_path is not None and os.path.isfile(driver_path)
+        if cache_valid and (offline or time.time() - resolved_at < max_age):
+            _DRIVER_PATH = driver_path
+        elif offline:
+            LOGGER.error(f'Offline mode: no usable chromedriver path cached in {cache_file}')
+            raise SE.BrowserStartException()
+        else:
+            _DRIVER_PATH = ChromeDriverManager().install()
+            _write_driver_cache(cache_file, _DRIVER_PATH)
+        return _DRIVER_PATH
+
+
+def apply_network_blocking(browser, profile):
+    """Block the profile's URL patterns in the current tab, Chrome keeps the blocked URLs per tab."""
+    blocked_urls = profile.blocked_urls
+    if not blocked_urls:
+        return
+    try:
+        browser.execute_cdp_cmd('Network.enable', {})
+        browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+    except:
+        LOGGER.debug(f'Could not block URLs of browser profile {profile.name}')
+
+
+def _psutil():
+    """psutil if it is installed, None otherwise."""
+    try: import psutil
+    except ImportError: return None
+    return psutil
+
+
+def rss_supported():
+    """Whether process_tree_rss can measure memory here: with psutil, or through /proc on Linux."""
+    return _psutil() is not None or sys.platform.startswith('linux')
+
+
+def process_tree(pid):
+    """pid and the pids of all its descendants, pid first.
+
+    Descendants are found through psutil if it is installed, otherwise through /proc on Linux. Elsewhere only pid is returned.
+    """
+    psutil = _psutil()
+    if psutil is not None:
+        try: return [pid] + [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error: return [pid]
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop(0)
+        pids.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            pass
+    return pids
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of a process and all its descendants, 0 where rss_supported() is False."""
+    rss = 0
+    psutil = _psutil()
+    if psutil is not None:
+        for current in process_tree(pid):
+            try: rss += psutil.Process(current).memory_info().rss
+            except psutil.Error: pass
+        return rss
+    if not sys.platform.startswith('linux'):
+        return rss
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                rss += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            pass
+    return rss
+
+
+def kill_process_tree(pid):
+    """Kill a process and the descendants process_tree finds, processes that are already gone are skipped."""
+    psutil = _psutil()
+    for current in process_tree(pid):
+        if psutil is not None:
+            try: psutil.Process(current).kill()
+            except psutil.Error: pass
+        else:
+            # SIGKILL does not exist on Windows, where os.kill with any other signal terminates the process
+            try: os.kill(current, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            except OSError: pass
+
+
+@SE.ExceptionHandler(SE.BrowserStartException, True)
+def open_browser(headless=True, driver_path=None, offline_driver=None, profile='default'):
+    """Start a Chrome configured for scraping.
+
+    Args:
+        headless (bool): Run Chrome without a window.
+        driver_path (str): chromedriver binary to use, resolved with resolve_driver_path if None.
+        offline_driver (bool): Passed to resolve_driver_path as offline.
+        profile (BrowserProfile): Profile, or name of a profile in PROFILES, the browser is set up with.
+    """
+    profile = get_profile(profile)
+    options = ChromeOptions()
+    prefs = {"profile.default_content_setting_values.notifications" : 2}
+    if 'image' in profile.blocked_resource_types:
+        prefs["profile.managed_default_content_settings.images"] = 2
+    options.add_experimental_option("prefs",prefs)
+    if headless == True:
+        options.add_argument("--headless")
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--use-gl=desktop')
+    options.add_argument('--log-level=3')
+    options.add_argument("--disable-extensions")
+    options.add_argument("--incognito")
+
+    if driver_path is None:
+        driver_path = resolve_driver_path(offline=offline_driver)
+    with SM.METRICS.time('browser_start'):
+        browser = Chrome(executable_path=driver_path, options=options,
+                         desired_capabilities={'pageLoadStrategy': profile.page_load_strategy})
+    if profile.page_load_timeout is not None:
+        browser.set_page_load_timeout(profile.page_load_timeout)
+    apply_network_blocking(browser, profile)
+    SM.METRICS.inc('browser_starts_total')
+    return browser
+
+
+
+class BrowserSession:
+    """A browser together with the Google state already set up in it.
+
+    Scrapers sharing a session skip the steps the browser has already been through: the switch of
+    Google to English and opening the Tools panel (which is a toggle, so clicking it again would close it).
+    The worker tab articles are opened in (see scraper_tabs.TabManager) is kept with the session as well.
+
+    Args:
+        browser: Selenium webdriver of the session.
+        profile (BrowserProfile): Profile the browser was started with.
+        browser_factory (callable): Starts a new browser for restart, a headless browser of profile if None.
+    """
+    def __init__(self, browser, profile=PROFILES['default'], browser_factory=None):
+        self.browser = browser
+        self.profile = profile
+        self.browser_factory = browser_factory if browser_factory is not None else functools.partial(open_browser, profile=profile)
+        self.language_set = False
+        self.tools_open = False
+        # scraper whose search the browser is currently showing
+        self.owner = None
+        self.jobs = 0
+        # window handles of the search tab and of the worker tab, and articles opened since the browser started
+        self.main_tab = None
+        self.worker_tab = None
+        self.articles = 0
+        self.restarts = 0
+
+    def reset_state(self):
+        """Forget the Google state, e.g. after the browser has been restarted."""
+        self.language_set = False
+        self.tools_open = False
+        self.owner = None
+
+    def pid(self):
+        """pid of the chromedriver process, Chrome runs as its child. None if unknown."""
+        try: return self.browser.service.process.pid
+        except AttributeError: return None
+
+    def rss(self):
+        """Resident memory in bytes of chromedriver and all Chrome processes, 0 if unknown."""
+        pid = self.pid()
+        return process_tree_rss(pid) if pid is not None else 0
+
+    def kill(self):
+        """Kill chromedriver and Chrome at once, commands waiting on the browser fail right away.
+
+        Without psutil outside Linux only chromedriver is killed, which is enough to fail the waiting commands.
+        """
+        pid = self.pid()
+        if pid is not None:
+            kill_process_tree(pid)
+
+    def restart(self):
+        """Quit the browser and start a new one, the Google state and the tabs of the old one are forgotten."""
+        self.close()
+        self.browser = self.browser_factory()
+        self.reset_state()
+        self.main_tab = None
+        self.worker_tab = None
+        self.articles = 0
+        self.restarts += 1
+
+    def alive(self):
+        try:
+            self.browser.window_handles
+            return True
+        except:
+            return False
+
+    def close(self):
+        try: self.browser.quit()
+        except: pass
+
+
+
+class SessionManager:
+    """Keep warm browser sessions that GoogleScraper jobs reuse one after another.
+
+    with manager.session() as session:
+        GoogleScraper(..., session=session).scrape()
+
+    Sessions are started on demand up to size and handed out one job at a time. A session whose browser
+    died is replaced, and a session is restarted after max_jobs_per_session jobs to bound Chrome's memory.
+
+    Args:
+        size (int): Maximum number of browser sessions.
+        headless (bool): Run Chrome without a window.
+        max_jobs_per_session (int): Jobs after which a session's browser is restarted, None for never.
+        driver_path (str): chromedriver binary, resolved once with resolve_driver_path if None.
+        offline_driver (bool): Passed to resolve_driver_path as offline.
+        browser_profile (BrowserProfile): Profile, or name of a profile in PROFILES, of the browsers.
+    """
+    def __init__(self, size=1, headless=True, max_jobs_per_session=None, driver_path=None, offline_driver=None, browser_profile='default'):
+        self.size = size
+        self.headless = headless
+        self.max_jobs_per_session = max_jobs_per_session
+        self.driver_path = driver_path
+        self.offline_driver = offline_driver
+        self.browser_profile = get_profile(browser_profile)
+        # idle sessions, the most recently used one is handed out first while its browser is warm
+        self._idle = []
+        self._condition = threading.Condition()
+        self._started = 0
+        self._closed = False
+
+    def _open_browser(self):
+        return open_browser(self.headless, self.driver_path, self.offline_driver, self.browser_profile)
+
+    def _new_session(self):
+        return BrowserSession(self._open_browser(), self.browser_profile, self._open_browser)
+
+    def _session_ended(self):
+        # a session slot became free, a waiting acquire may start a browser in it
+        with self._condition:
+            self._started -= 1
+            self._condition.notify()
+
+    def acquire(self, timeout=None):
+        """Return an idle session, starting a browser if none is idle and fewer than size are running.
+
+        Waits until a session is released or a slot becomes free (a session was recycled or died),
+        raises queue.Empty if none did within timeout.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise SE.BrowserStartException()
+                if self._idle:
+                    session = self._idle.pop()
+                    break
+                if self._started < self.size:
+                    self._started += 1
+                    session = None
+                    break
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty()
+                self._condition.wait(remaining)
+        if session is None:
+            session = self._start_session()
+        elif not session.alive():
+            LOGGER.debug('Replacing a session whose browser died')
+            session.close()
+            session = self._start_session()
+        session.jobs += 1
+        return session
+
+    def _start_session(self):
+        try:
+            return self._new_session()
+        except:
+            self._session_ended()
+            raise
+
+    def release(self, session):
+        """Give a session back so the next job can reuse it."""
+        recycle = self.max_jobs_per_session is not None and session.jobs >= self.max_jobs_per_session
+        with self._condition:
+            closed = self._closed
+        if closed or recycle or not session.alive():
+            session.close()
+            self._session_ended()
+            return
+        with self._condition:
+            self._idle.append(session)
+            self._condition.notify()
+
+    @contextmanager
+    def session(self, timeout=None):
+        session = self.acquire(timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def close(self):
+        """Quit the browsers of all idle sessions, sessions in use are quit when released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            # waiting acquires fail now that the manager is closed
+            self._condition.notify_all()
+        for session in idle:
+            session.close()
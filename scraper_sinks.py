@@ -0,0 +1,253 @@
+import csv
+import json
+import re
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import scraper_exceptions as SE
+
+
+
+COLUMNS = ['title', 'headers', 'text', 'date', 'link']
+
+
+
+def period_file_name(keyword, from_d, to_d, extension, part=None):
+    """File name of the output of one search period, e.g. 06-01-2019_to_06-02-2019_Airline_Stocks.csv
+
+    With part the file is one part of the period's output, e.g. 06-01-2019_to_06-02-2019_Airline_Stocks.part-node1.csv
+    """
+    name = f'{from_d}_to_{to_d}_{keyword}' + (f'.part-{part}' if part is not None else '')
+    return name.replace('/', '-').replace(' ', '_') + extension
+
+
+
+class ArticleSink(ABC):
+    """Destination that articles are streamed to as soon as they are extracted.
+
+    Articles are buffered per (keyword, from_d, to_d) partition and written in batches of batch_size.
+    Sinks are shared between threads, all methods are thread safe.
+
+    Args:
+        location (str): Directory the output is written to.
+        batch_size (int): Number of buffered articles of a partition that triggers a write.
+        append (bool): Append to output of an earlier run (used when resuming) instead of overwriting it. Articles
+            whose link is already in the output of their period are skipped, rows written after the last journaled page
+            of a crashed run are therefore not written again.
+        part (str): Write to part files of this name, so several processes can write the output of the same period.
+            Only this sink writes its part files, so what it knows about their content (e.g. their links) is kept
+            after close_period and a part file reopened for another unit of its period is not read again.
+    """
+    def __init__(self, location, batch_size=50, append=False, part=None):
+        self.location = Path(location)
+        self.batch_size = batch_size
+        self.append = append
+        self.part = part
+        self._buffers = {}
+        self._links = {}
+        self._lock = threading.RLock()
+
+    def write(self, article, keyword, from_d, to_d):
+        partition = (keyword, from_d, to_d)
+        with self._lock:
+            if self.append:
+                if partition not in self._links:
+                    self._links[partition] = self._existing_links(partition)
+                if article['link'] in self._links[partition]:
+                    return
+                self._links[partition].add(article['link'])
+            buffer = self._buffers.setdefault(partition, [])
+            buffer.append({column: article[column] for column in COLUMNS})
+            if len(buffer) >= self.batch_size:
+                self._flush_partition(partition)
+
+    def flush(self):
+        """Write all buffered articles."""
+        with self._lock:
+            for partition in list(self._buffers):
+                self._flush_partition(partition)
+
+    def close_period(self, keyword, from_d, to_d):
+        """Write the buffered articles of a finished period and release its resources."""
+        partition = (keyword, from_d, to_d)
+        with self._lock:
+            self._flush_partition(partition)
+            self._buffers.pop(partition, None)
+            if self.part is None:
+                self._links.pop(partition, None)
+            self._close_partition(partition)
+
+    def close(self):
+        with self._lock:
+            for partition in list(self._buffers):
+                self.close_period(*partition)
+
+    @SE.ExceptionHandler(SE.OutputWriteException, raise_error=True)
+    def _flush_partition(self, partition):
+        rows = self._buffers.get(partition)
+        if rows:
+            self._write_batch(partition, rows)
+            self._buffers[partition] = []
+
+    @abstractmethod
+    def _write_batch(self, partition, rows):
+        pass
+
+    def _existing_links(self, partition):
+        """Links already in the output of a partition, read when appending."""
+        return set()
+
+    def _close_partition(self, partition):
+        pass
+
+
+
+class _FileSink(ArticleSink):
+    """Sink writing one open file per search period."""
+    EXTENSION = ''
+
+    def __init__(self, location, batch_size=50, append=False, part=None):
+        super().__init__(location, batch_size, append, part)
+        self._files = {}
+
+    def _path(self, partition):
+        return self.location / period_file_name(*partition, self.EXTENSION, self.part)
+
+    def _file(self, partition):
+        if partition not in self._files:
+            path = self._path(partition)
+            existed = self.append and path.exists()
+            self._files[partition] = open(path, 'a' if existed else 'w', encoding='utf-8', newline='')
+            self._opened(partition, path, existed)
+        return self._files[partition]
+
+    def _opened(self, partition, path, existed):
+        pass
+
+    def _existing_links(self, partition):
+        path = self._path(partition)
+        if not path.exists():
+            return set()
+        with open(path, encoding='utf-8', newline='') as f:
+            return set(self._read_links(f))
+
+    def _read_links(self, f):
+        return ()
+
+    def _close_partition(self, partition):
+        # periods without any article still get their (empty) file, like the DataFrame output did
+        self._file(partition).close()
+        del self._files[partition]
+
+
+
+class CSVSink(_FileSink):
+    """One CSV file per search period with an index column, as written by pandas.DataFrame.to_csv."""
+    EXTENSION = '.csv'
+
+    def __init__(self, location, batch_size=50, append=False, part=None):
+        super().__init__(location, batch_size, append, part)
+        self._row_counts = {}
+
+    def _opened(self, partition, path, existed):
+        if existed:
+            if partition not in self._row_counts:
+                with open(path, encoding='utf-8', newline='') as f:
+                    self._row_counts[partition] = max(sum(1 for _ in csv.reader(f)) - 1, 0)
+        else:
+            self._row_counts[partition] = 0
+            csv.writer(self._files[partition], lineterminator='\n').writerow([''] + COLUMNS)
+
+    def _read_links(self, f):
+        return (row['link'] for row in csv.DictReader(f))
+
+    def _write_batch(self, partition, rows):
+        f = self._file(partition)
+        writer = csv.writer(f, lineterminator='\n')
+        for row in rows:
+            writer.writerow([self._row_counts[partition]] + [row[column] for column in COLUMNS])
+            self._row_counts[partition] += 1
+        f.flush()
+
+    def _close_partition(self, partition):
+        super()._close_partition(partition)
+        if self.part is None:
+            del self._row_counts[partition]
+
+
+
+class JSONLSink(_FileSink):
+    """One JSON lines file per search period."""
+    EXTENSION = '.jsonl'
+
+    def _read_links(self, f):
+        for line in f:
+            try: yield json.loads(line)['link']
+            except (ValueError, KeyError): continue # a line cut short by a crash
+
+    def _write_batch(self, partition, rows):
+        f = self._file(partition)
+        f.writelines(json.dumps(row) + '\n' for row in rows)
+        f.flush()
+
+
+
+class ParquetSink(ArticleSink):
+    """Parquet dataset partitioned by keyword and period, one part file per batch.
+
+    Requires pyarrow.
+    """
+    def __init__(self, location, batch_size=500, append=False, part=None):
+        super().__init__(location, batch_size, append, part)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError('ParquetSink requires pyarrow (pip install pyarrow)') from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._part_counts = {}
+
+    def _partition_dir(self, partition):
+        keyword, from_d, to_d = partition
+        period = f'{from_d}_to_{to_d}'.replace('/', '-')
+        return self.location / f"keyword={keyword.replace('/', '-')}" / f'period={period}'
+
+    def _prefix(self):
+        return f'part-{self.part}-' if self.part is not None else 'part-'
+
+    def _own_parts(self, directory):
+        """Part files of this sink in a partition directory, e.g. part-00003.parquet, or part-node1-00003.parquet with part='node1'.
+
+        Part files of other writers (other part names) never match, even if their name starts with this sink's prefix.
+        """
+        name = re.compile(re.escape(self._prefix()) + r'[0-9]{5,}\.parquet')
+        return [path for path in directory.glob(f'{self._prefix()}*.parquet') if name.fullmatch(path.name)]
+
+    def _existing_links(self, partition):
+        links = set()
+        for part_file in self._own_parts(self._partition_dir(partition)):
+            links.update(self._pq.read_table(str(part_file), columns=['link']).column('link').to_pylist())
+        return links
+
+    def _write_batch(self, partition, rows):
+        directory = self._partition_dir(partition)
+        prefix = self._prefix()
+        if partition not in self._part_counts:
+            directory.mkdir(parents=True, exist_ok=True)
+            own_parts = self._own_parts(directory)
+            self._part_counts[partition] = len(own_parts) if self.append else 0
+            if not self.append:
+                for old_part in own_parts:
+                    old_part.unlink()
+        table = self._pa.Table.from_pydict({column: [row[column] for row in rows] for column in COLUMNS})
+        self._pq.write_table(table, str(directory / f'{prefix}{self._part_counts[partition]:05d}.parquet'))
+        self._part_counts[partition] += 1
+
+    def _close_partition(self, partition):
+        self._part_counts.pop(partition, None)
+
+
+
+SINKS = {'csv': CSVSink, 'jsonl': JSONLSink, 'parquet': ParquetSink}
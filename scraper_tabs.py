@@ -0,0 +1,142 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+import scraper_metrics as SM
+import scraper_session as SSession
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+
+class TabManager:
+    """Open articles in a reused worker tab and keep the browser of a session healthy.
+
+    with tabs.worker_tab():
+        ...  # load and extract an article in the current tab
+
+    The worker tab is opened once per browser and reused for every article (Chrome's blocked URLs are set
+    up once per tab), instead of opening and closing a tab per article. Articles are loaded one at a time, so
+    a single worker tab is all that is needed. Before an article is opened the browser is restarted once it
+    opened max_articles articles or its process tree uses more than max_rss_mb, which bounds the memory Chrome
+    accumulates over hours. A watchdog kills the browser when an article takes longer than hang_timeout, the
+    article is given up as empty and the browser is restarted. Time the article waits for the rate limiter does
+    not count, the caller pauses the watchdog for it and starts it over with watch once the load may begin.
+
+    Restarts only happen between articles. The links of the results page being scraped are already collected,
+    so its remaining articles are opened in the new browser; the session's Google state is reset, so the next
+    results page sets the search up again (navigation='ui') or simply loads its URL (navigation='url').
+
+    Args:
+        session (BrowserSession): Session whose browser the tab belongs to.
+        max_articles (int): Articles after which the browser is restarted, None for never.
+        max_rss_mb (float): Memory of Chrome in MB after which the browser is restarted, None for never. Needs psutil outside Linux.
+        hang_timeout (float): Seconds an article may take before its browser is killed, None for no watchdog.
+    """
+    def __init__(self, session, max_articles=None, max_rss_mb=None, hang_timeout=120):
+        self.session = session
+        self.max_articles = max_articles
+        if max_rss_mb is not None and not SSession.rss_supported():
+            LOGGER.warning('Restarting the browser by memory is disabled, measuring the memory of Chrome needs psutil outside Linux')
+            max_rss_mb = None
+        self.max_rss_mb = max_rss_mb
+        self.hang_timeout = hang_timeout
+        # the watchdog only kills the browser it watches, and only while the article is still open
+        self._watched = None
+        self._hung = False
+        self._watchdog = None
+        self._lock = threading.Lock()
+
+    def _recycle_reason(self):
+        if self.max_articles is not None and self.session.articles >= self.max_articles:
+            return 'articles'
+        if self.max_rss_mb is not None and self.session.rss() > self.max_rss_mb * 1024**2:
+            return 'rss'
+        return None
+
+    def recycle(self, reason):
+        """Restart the browser of the session."""
+        LOGGER.info(f'Restarting the browser ({reason}) after {self.session.articles} articles')
+        SM.METRICS.inc('browser_recycles_total', reason=reason)
+        self.session.restart()
+
+    def _open_worker_tab(self):
+        browser = self.session.browser
+        handles = browser.window_handles
+        if self.session.main_tab is None:
+            self.session.main_tab = handles[0]
+        # an article may have closed its own tab
+        if self.session.worker_tab not in handles:
+            browser.execute_script("window.open('about:blank');")
+            self.session.worker_tab = next(iter(set(browser.window_handles) - set(handles)))
+            browser.switch_to.window(self.session.worker_tab)
+            SSession.apply_network_blocking(browser, self.session.profile)
+        return self.session.worker_tab
+
+    def _kill_hung(self, browser):
+        with self._lock:
+            if self._watched is not browser:
+                return
+            LOGGER.warning(f'Article did not finish within {self.hang_timeout}s, killing the browser')
+            SM.METRICS.inc('hung_pages_total')
+            self._hung = True
+            self.session.kill()
+
+    def _cancel_watchdog(self):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+
+    def watch(self):
+        """Start the hang watchdog of the current article over, e.g. once its page load got past the rate limiter."""
+        with self._lock:
+            self._cancel_watchdog()
+            if self._watched is None or self._hung or self.hang_timeout is None:
+                return
+            self._watchdog = threading.Timer(self.hang_timeout, self._kill_hung, (self._watched,))
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def pause(self):
+        """Stop the hang watchdog of the current article until watch is called, e.g. while it waits for the rate limiter."""
+        with self._lock:
+            self._cancel_watchdog()
+
+    def _unwatch(self):
+        """Stop watching the article, returns whether the watchdog killed the browser. It cannot kill it afterwards."""
+        with self._lock:
+            self._cancel_watchdog()
+            self._watched = None
+            return self._hung
+
+    @contextmanager
+    def worker_tab(self):
+        """Switch the browser to the worker tab for the duration of the block, then back to the search tab.
+
+        An error in the block is swallowed if the watchdog killed the browser during it.
+        """
+        reason = self._recycle_reason()
+        if reason is not None:
+            self.recycle(reason)
+        tab = self._open_worker_tab()
+        browser = self.session.browser
+        browser.switch_to.window(tab)
+
+        with self._lock:
+            self._watched = browser
+            self._hung = False
+        self.watch()
+        try:
+            yield tab
+        except Exception:
+            if not self._unwatch():
+                raise
+        finally:
+            hung = self._unwatch()
+            self.session.articles += 1
+        if hung:
+            self.recycle('hung')
+        else:
+            browser.switch_to.window(self.session.main_tab)
@@ -0,0 +1,638 @@
+"""Work queue spreading scrape jobs over independent worker processes on any number of machines.
+
+Usage:
+    python scraper_workqueue.py enqueue /shared/queue.db jobs.jsonl --output-dir /shared/output
+    python scraper_workqueue.py worker /shared/queue.db        (on every node, as many as wanted)
+    python scraper_workqueue.py status /shared/queue.db
+
+The queue is a SQLite file (.db, .sqlite, .sqlite3) or a directory on storage all nodes share, no other
+service is needed. Job files are the ones scraper_batch reads. Workers claim (keyword, period, page) units
+under a lease they renew with heartbeats while scraping; the units of a worker that dies are handed out
+again once its leases expire. Every worker writes its own part file of each period's output
+(e.g. 06-01-2019_to_06-02-2019_Airline_Stocks.part-node1-4711.csv), so workers never write to the same file.
+Units are processed at least once: a unit whose worker dies after writing its articles is scraped again.
+Leases of the SQLite queue expire by the clocks of the nodes, which have to be synchronized (e.g. by NTP).
+The directory queue judges leases by the clock of the shared storage instead.
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+import scraper_batch as SB
+import scraper_classes as SC
+import scraper_exceptions as SE
+import scraper_fetching as SF
+import scraper_logging as SL
+import scraper_metrics as SM
+import scraper_pool as SP
+import scraper_session as SSession
+import scraper_sinks as SSinks
+
+
+
+LOGGER = logging.getLogger(__name__)
+
+Unit = namedtuple('Unit', ['job_id', 'period', 'page'])
+
+FINAL_STATES = ('done', 'skipped', 'failed')
+
+
+
+class WorkQueue(ABC):
+    """Queue of (job, period, page) units shared by worker processes.
+
+    Units are claimed under a lease of lease_seconds. A lease that is not renewed by heartbeat in time
+    expires and its unit is handed out again, after max_attempts claims a unit is given up as failed.
+    Units are handed out page by page over all periods and jobs, so every job progresses at the same pace
+    and the last results page of a period is known before its later pages are claimed.
+
+    Args:
+        lease_seconds (float): Seconds a claimed unit stays leased without a heartbeat.
+        max_attempts (int): How many times a unit is claimed before it is given up.
+    """
+    def __init__(self, lease_seconds=300, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    @SE.ExceptionHandler(SE.WorkQueueException, raise_error=True)
+    def enqueue(self, spec):
+        """Add a job and all its units.
+
+        Args:
+            spec (dict): GoogleScraper arguments of the job, JSON serializable.
+
+        Returns:
+            int: Id of the job.
+        """
+        spec = {key: (str(value) if isinstance(value, Path) else value) for key, value in spec.items()}
+        periods = len(SC.GoogleScraper.generate_date_ranges(spec['search_start_date'], spec['periods'], spec.get('periodicity', 'M')))
+        pages = spec.get('google_results_pages', 5)
+        units = [(period_no, page_no) for period_no in range(1, periods+1) for page_no in range(1, pages+1)]
+        return self._add_job(spec, units)
+
+    def finished(self):
+        """True if no unit is pending or leased any more."""
+        return all(state in FINAL_STATES for counts in self.status().values() for state in counts['units'])
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def _add_job(self, spec, units):
+        pass
+
+    @abstractmethod
+    def jobs(self):
+        """Return {job_id: spec} of all jobs."""
+
+    @abstractmethod
+    def claim(self, worker_id):
+        """Lease the next pending unit to the worker. Returns the Unit, or None if no unit is pending."""
+
+    @abstractmethod
+    def heartbeat(self, worker_id, unit):
+        """Renew the worker's lease of the unit. Returns False if the worker lost the lease."""
+
+    @abstractmethod
+    def complete(self, worker_id, unit, articles):
+        """Mark a leased unit done. Returns False if the worker lost the lease and the unit was handed out again."""
+
+    @abstractmethod
+    def release(self, worker_id, unit, count_attempt=True):
+        """Give a leased unit back to the queue, e.g. after a browser crash or throttling (count_attempt=False)."""
+
+    @abstractmethod
+    def set_last_page(self, job_id, period_no, page_no):
+        """Skip the pending units of the period after page_no, the period has no more results pages."""
+
+    @abstractmethod
+    def requeue_expired(self):
+        """Hand out the units of expired leases again. Returns the number of units requeued."""
+
+    @abstractmethod
+    def status(self):
+        """Return {job_id: {'keyword': str, 'units': {state: count}, 'articles': int}}."""
+
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """Work queue in a SQLite file.
+
+    Every operation is one short write transaction, workers on other nodes wait for the file lock.
+    The file can be on a network share as long as it supports file locking, the rollback journal
+    (not WAL) is used for that reason.
+
+    Args:
+        path (str): Location of the SQLite file.
+    """
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        super().__init__(lease_seconds, max_attempts)
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self._transaction() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                      job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                      spec TEXT NOT NULL,
+                                      created_at REAL NOT NULL)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS units (
+                                      job_id INTEGER NOT NULL,
+                                      period INTEGER NOT NULL,
+                                      page INTEGER NOT NULL,
+                                      state TEXT NOT NULL DEFAULT 'pending',
+                                      worker TEXT,
+                                      lease_expires REAL,
+                                      attempts INTEGER NOT NULL DEFAULT 0,
+                                      articles INTEGER,
+                                      PRIMARY KEY (job_id, period, page))""")
+            connection.execute("CREATE INDEX IF NOT EXISTS units_state ON units (state, page, period, job_id)")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+            except:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def _add_job(self, spec, units):
+        with self._transaction() as connection:
+            job_id = connection.execute("INSERT INTO jobs (spec, created_at) VALUES (?, ?)", (json.dumps(spec), time.time())).lastrowid
+            connection.executemany("INSERT INTO units (job_id, period, page) VALUES (?, ?, ?)",
+                                   [(job_id, period_no, page_no) for period_no, page_no in units])
+        return job_id
+
+    def jobs(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT job_id, spec FROM jobs").fetchall()
+        return {job_id: json.loads(spec) for job_id, spec in rows}
+
+    def _requeue_expired(self, connection):
+        expired = connection.execute("UPDATE units SET state = 'pending', worker = NULL WHERE state = 'leased' AND lease_expires < ?",
+                                     (time.time(),)).rowcount
+        connection.execute("UPDATE units SET state = 'failed' WHERE state = 'pending' AND attempts >= ?", (self.max_attempts,))
+        if expired:
+            LOGGER.info(f'{expired} expired leases requeued')
+            SM.METRICS.inc('leases_expired_total', expired)
+        return expired
+
+    def requeue_expired(self):
+        with self._transaction() as connection:
+            return self._requeue_expired(connection)
+
+    def claim(self, worker_id):
+        with self._transaction() as connection:
+            self._requeue_expired(connection)
+            row = connection.execute("SELECT job_id, period, page FROM units WHERE state = 'pending' "
+                                     "ORDER BY page, period, job_id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE units SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                               "WHERE job_id = ? AND period = ? AND page = ?",
+                               (worker_id, time.time() + self.lease_seconds, *row))
+        return Unit(*row)
+
+    def heartbeat(self, worker_id, unit):
+        with self._transaction() as connection:
+            return connection.execute("UPDATE units SET lease_expires = ? WHERE job_id = ? AND period = ? AND page = ? "
+                                      "AND state = 'leased' AND worker = ?",
+                                      (time.time() + self.lease_seconds, *unit, worker_id)).rowcount == 1
+
+    def complete(self, worker_id, unit, articles):
+        # an expired lease that nobody claimed again yet still counts
+        with self._transaction() as connection:
+            return connection.execute("UPDATE units SET state = 'done', worker = ?, articles = ? WHERE job_id = ? AND period = ? AND page = ? "
+                                      "AND (state = 'pending' OR (state = 'leased' AND worker = ?))",
+                                      (worker_id, articles, *unit, worker_id)).rowcount == 1
+
+    def release(self, worker_id, unit, count_attempt=True):
+        with self._transaction() as connection:
+            connection.execute("UPDATE units SET state = 'pending', worker = NULL, attempts = attempts - ? "
+                               "WHERE job_id = ? AND period = ? AND page = ? AND state = 'leased' AND worker = ?",
+                               (0 if count_attempt else 1, *unit, worker_id))
+
+    def set_last_page(self, job_id, period_no, page_no):
+        with self._transaction() as connection:
+            connection.execute("UPDATE units SET state = 'skipped' WHERE job_id = ? AND period = ? AND page > ? AND state = 'pending'",
+                               (job_id, period_no, page_no))
+
+    def status(self):
+        jobs = self.jobs()
+        with self._lock:
+            rows = self._connection.execute("SELECT job_id, state, COUNT(*), COALESCE(SUM(articles), 0) FROM units GROUP BY job_id, state").fetchall()
+        status = {job_id: {'keyword': spec['keyword'], 'units': {}, 'articles': 0} for job_id, spec in jobs.items()}
+        for job_id, state, count, articles in rows:
+            status[job_id]['units'][state] = count
+            status[job_id]['articles'] += articles
+        return status
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+
+class DirectoryWorkQueue(WorkQueue):
+    """Work queue kept as files in a directory.
+
+    Every unit is a file that moves between the pending, leased and done folders. A move is a rename,
+    which is atomic, so of several workers renaming the same pending file exactly one wins the unit.
+    The modification time of a leased file is the start of its lease, heartbeats touch it. Modification
+    times are set by the storage (e.g. the NFS server), and leases are judged against the storage's clock
+    as well (see _now), so the clocks of the nodes do not have to agree. On storage that takes modification
+    times from its clients, the node clocks have to be synchronized.
+
+    Args:
+        path (str): Directory of the queue.
+    """
+    FOLDERS = ('jobs', 'pending', 'leased', 'done', 'last_pages')
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        super().__init__(lease_seconds, max_attempts)
+        self.path = Path(path)
+        for folder in self.FOLDERS:
+            (self.path / folder).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _name(unit):
+        return f'{unit.job_id}_{unit.period}_{unit.page}'
+
+    @staticmethod
+    def _unit(name):
+        return Unit(*(int(number) for number in name.split('@')[0].split('_')))
+
+    @staticmethod
+    def _write(path, data):
+        temp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        temp_path.write_text(json.dumps(data), encoding='utf-8')
+        temp_path.replace(path)
+
+    @staticmethod
+    def _read(path):
+        try: return json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError): return {}
+
+    def _add_job(self, spec, units):
+        job_id = len(os.listdir(self.path / 'jobs')) + 1
+        while True:
+            # creating the job file exclusively reserves the job id
+            try: fd = os.open(self.path / 'jobs' / f'{job_id}.json', os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                job_id += 1
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(spec, f)
+            break
+        for period_no, page_no in units:
+            self._write(self.path / 'pending' / self._name(Unit(job_id, period_no, page_no)), {'attempts': 0})
+        return job_id
+
+    def jobs(self):
+        jobs = {}
+        for path in (self.path / 'jobs').glob('*.json'):
+            spec = self._read(path)
+            if spec:
+                jobs[int(path.stem)] = spec
+        return jobs
+
+    def _last_page(self, job_id, period_no):
+        return self._read(self.path / 'last_pages' / f'{job_id}_{period_no}').get('page')
+
+    def _finish(self, source, unit, **data):
+        """Move a unit file to done. Returns False if it was moved away by someone else first."""
+        target = self.path / 'done' / self._name(unit)
+        try: os.rename(source, target)
+        except FileNotFoundError: return False
+        self._write(target, dict(self._read(target), **data))
+        return True
+
+    def _now(self):
+        """Current time by the clock of the storage: the modification time of a file this process just touched."""
+        probe = self.path / f'.clock-{socket.gethostname()}-{os.getpid()}'
+        probe.touch()
+        return os.stat(probe).st_mtime
+
+    def requeue_expired(self):
+        expired = 0
+        now = self._now()
+        for name in os.listdir(self.path / 'leased'):
+            path = self.path / 'leased' / name
+            try:
+                if os.stat(path).st_mtime + self.lease_seconds >= now:
+                    continue
+                os.rename(path, self.path / 'pending' / name.split('@')[0])
+                expired += 1
+            except FileNotFoundError:
+                pass
+        if expired:
+            LOGGER.info(f'{expired} expired leases requeued')
+            SM.METRICS.inc('leases_expired_total', expired)
+        return expired
+
+    def claim(self, worker_id):
+        self.requeue_expired()
+        names = sorted((name for name in os.listdir(self.path / 'pending') if not name.startswith('.')),
+                       key=lambda name: self._unit(name)[::-1])
+        for name in names:
+            unit = self._unit(name)
+            source = self.path / 'pending' / name
+            last_page = self._last_page(unit.job_id, unit.period)
+            if last_page is not None and unit.page > last_page:
+                self._finish(source, unit, state='skipped')
+                continue
+            leased = self.path / 'leased' / f'{name}@{worker_id}'
+            try:
+                os.rename(source, leased)
+                # the renamed file keeps the mtime of the pending unit, start the lease before
+                # requeue_expired on another node can take it for an expired one
+                os.utime(leased)
+            except FileNotFoundError: continue # claimed by another worker first
+            data = self._read(leased)
+            data['attempts'] = data.get('attempts', 0) + 1
+            if data['attempts'] > self.max_attempts:
+                self._finish(leased, unit, state='failed')
+                continue
+            self._write(leased, data)
+            return unit
+        return None
+
+    def heartbeat(self, worker_id, unit):
+        try:
+            os.utime(self.path / 'leased' / f'{self._name(unit)}@{worker_id}')
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, worker_id, unit, articles):
+        if self._finish(self.path / 'leased' / f'{self._name(unit)}@{worker_id}', unit, state='done', worker=worker_id, articles=articles):
+            return True
+        # an expired lease that nobody claimed again yet still counts
+        return self._finish(self.path / 'pending' / self._name(unit), unit, state='done', worker=worker_id, articles=articles)
+
+    def release(self, worker_id, unit, count_attempt=True):
+        leased = self.path / 'leased' / f'{self._name(unit)}@{worker_id}'
+        if not count_attempt:
+            data = self._read(leased)
+            if data:
+                data['attempts'] = max(data.get('attempts', 1) - 1, 0)
+                self._write(leased, data)
+        try: os.rename(leased, self.path / 'pending' / self._name(unit))
+        except FileNotFoundError: pass
+
+    def set_last_page(self, job_id, period_no, page_no):
+        last_page = self._last_page(job_id, period_no)
+        self._write(self.path / 'last_pages' / f'{job_id}_{period_no}', {'page': page_no if last_page is None else min(page_no, last_page)})
+        for name in os.listdir(self.path / 'pending'):
+            if name.startswith('.'):
+                continue
+            unit = self._unit(name)
+            if unit.job_id == job_id and unit.period == period_no and unit.page > page_no:
+                self._finish(self.path / 'pending' / name, unit, state='skipped')
+
+    def status(self):
+        status = {job_id: {'keyword': spec['keyword'], 'units': {}, 'articles': 0} for job_id, spec in self.jobs().items()}
+        for folder in ('pending', 'leased', 'done'):
+            for name in os.listdir(self.path / folder):
+                if name.startswith('.'):
+                    continue
+                unit = self._unit(name)
+                if unit.job_id not in status:
+                    continue
+                state = folder
+                if folder == 'done':
+                    data = self._read(self.path / folder / name)
+                    state = data.get('state', 'done')
+                    status[unit.job_id]['articles'] += data.get('articles') or 0
+                units = status[unit.job_id]['units']
+                units[state] = units.get(state, 0) + 1
+        return status
+
+
+
+def open_work_queue(location, lease_seconds=300, max_attempts=3):
+    """Open the SQLite work queue of a .db/.sqlite/.sqlite3 file, or the directory work queue of any other path."""
+    if Path(location).suffix in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteWorkQueue(location, lease_seconds, max_attempts)
+    return DirectoryWorkQueue(location, lease_seconds, max_attempts)
+
+
+
+class _Heartbeat(threading.Thread):
+    """Renews the lease of the unit a worker is scraping."""
+    def __init__(self, work_queue, worker_id, interval):
+        super().__init__(name='workqueue-heartbeat', daemon=True)
+        self.work_queue = work_queue
+        self.worker_id = worker_id
+        self.interval = interval
+        self.unit = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            unit = self.unit
+            if unit is None:
+                continue
+            try:
+                if not self.work_queue.heartbeat(self.worker_id, unit):
+                    LOGGER.warning(f'Lost the lease of {unit}')
+            except Exception:
+                LOGGER.debug(f'Heartbeat of {unit} failed')
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+
+class _LeasedUnits(SP.UnitQueue):
+    """Hands the units a QueueWorker scraped back to its WorkQueue, see scraper_pool.run_unit."""
+    def __init__(self, worker):
+        self.worker = worker
+
+    def requeue(self, scraper, unit, count_attempt=True):
+        self.worker.work_queue.release(self.worker.worker_id, unit, count_attempt)
+
+    def end_period(self, scraper, unit, last_page):
+        self.worker.work_queue.set_last_page(unit.job_id, unit.period, last_page)
+        self.worker.work_queue.complete(self.worker.worker_id, unit, 0)
+
+    def complete(self, scraper, unit, articles):
+        # the part file of the period is closed after every unit, other units of the period may go to other workers,
+        # the sink keeps the links and row count of its part files so reopening one does not read it again
+        from_d, to_d = scraper.period_dates(unit.period)
+        self.worker._sinks[unit.job_id].close_period(scraper.keyword, from_d, to_d)
+        if not self.worker.work_queue.complete(self.worker.worker_id, unit, len(articles)):
+            LOGGER.warning(f'{unit} was completed after its lease expired, its articles may be written twice')
+        self.worker.units_done += 1
+        LOGGER.info(f'[{scraper.keyword}] period {unit.period}, page {unit.page} done: {len(articles)} articles')
+
+
+
+class QueueWorker:
+    """Worker process scraping the units of a WorkQueue.
+
+    The worker keeps one warm browser session for all jobs and writes each job's articles to its own
+    part files in the job's save_to_location.
+
+    Args:
+        work_queue (WorkQueue): Queue to pull units from.
+        worker_id (str): Name of the worker, unique over all nodes. Defaults to <hostname>-<pid>.
+        headless (bool): Run Chrome without a window.
+        browser_profile (str): Browser profile, see scraper_session.PROFILES.
+        max_concurrent_fetches (int): Article requests in flight at the same time.
+        sink_format (str): Output format, a key of scraper_sinks.SINKS.
+        poll_interval (float): Seconds to wait when no unit is pending but others are still leased.
+        exit_when_finished (bool): Stop once no unit is pending or leased, instead of waiting for new jobs.
+    """
+    def __init__(self, work_queue, worker_id=None, headless=True, browser_profile='default', max_concurrent_fetches=8,
+                 sink_format='csv', poll_interval=5, exit_when_finished=True):
+        self.work_queue = work_queue
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.headless = headless
+        self.browser_profile = browser_profile
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.sink_format = sink_format
+        self.poll_interval = poll_interval
+        self.exit_when_finished = exit_when_finished
+        self.units_done = 0
+        self._specs = {}
+        self._sinks = {}
+        self._scrapers = {}
+        self._session = None
+        self._article_fetcher = None
+        self._units = _LeasedUnits(self)
+
+    def _spec(self, job_id):
+        if job_id not in self._specs:
+            self._specs = self.work_queue.jobs()
+        return SB.job_scraper_kwargs(job_id, self._specs[job_id])
+
+    def _scraper(self, job_id):
+        if job_id not in self._scrapers:
+            spec = self._spec(job_id)
+            Path(spec['save_to_location']).mkdir(parents=True, exist_ok=True)
+            self._sinks[job_id] = SSinks.SINKS[self.sink_format](spec['save_to_location'], append=True, part=self.worker_id)
+            self._scrapers[job_id] = SC.GoogleScraper(**spec,
+                                                      session=self._session,
+                                                      sinks=[self._sinks[job_id]],
+                                                      article_fetcher=self._article_fetcher)
+        return self._scrapers[job_id]
+
+    def _close_scrapers(self):
+        for scraper in self._scrapers.values():
+            scraper.close()
+        self._scrapers.clear()
+
+    def _open_session(self):
+        # browsers the session restarts itself (see scraper_tabs.TabManager) are started the same way
+        open_browser = functools.partial(SSession.open_browser, self.headless, profile=self.browser_profile)
+        return SSession.BrowserSession(open_browser(), SSession.get_profile(self.browser_profile), open_browser)
+
+    def _restart_browser(self):
+        self._close_scrapers()
+        self._session.close()
+        self._session = self._open_session()
+
+    def _scrape_unit(self, unit):
+        scraper = self._scraper(unit.job_id)
+        if not SP.run_unit(self._units, scraper, unit, scraper, self._session.alive):
+            self._restart_browser()
+
+    def run(self):
+        """Scrape units until the queue is finished (or forever, with exit_when_finished=False). Returns the number of units done."""
+        self._session = self._open_session()
+        self._article_fetcher = SF.ArticleFetcher(self.max_concurrent_fetches)
+        heartbeat = _Heartbeat(self.work_queue, self.worker_id, self.work_queue.lease_seconds / 3)
+        heartbeat.start()
+        try:
+            while True:
+                unit = self.work_queue.claim(self.worker_id)
+                if unit is None:
+                    if self.exit_when_finished and self.work_queue.finished():
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                heartbeat.unit = unit
+                try:
+                    self._scrape_unit(unit)
+                finally:
+                    heartbeat.unit = None
+        finally:
+            heartbeat.stop()
+            self._close_scrapers()
+            for sink in self._sinks.values():
+                sink.close()
+            self._article_fetcher.close()
+            self._session.close()
+        return self.units_done
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lease-seconds', type=float, default=300)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = commands.add_parser('enqueue', help='Add the jobs of a job file to the queue')
+    enqueue.add_argument('queue', help='SQLite file (.db) or directory of the queue')
+    enqueue.add_argument('job_file', help='JSON or JSON lines file with the job specs, see scraper_batch')
+    enqueue.add_argument('--output-dir', default=Path.cwd(), help='Folder of the jobs without a save_to_location, shared by all nodes')
+
+    worker = commands.add_parser('worker', help='Scrape units of the queue until it is finished')
+    worker.add_argument('queue')
+    worker.add_argument('--worker-id', default=None)
+    worker.add_argument('--browser-profile', default='default')
+    worker.add_argument('--max-concurrent-fetches', type=int, default=8)
+    worker.add_argument('--sink-format', choices=sorted(SSinks.SINKS), default='csv')
+    worker.add_argument('--keep-running', action='store_true', help='Wait for new jobs once the queue is finished')
+    worker.add_argument('--no-headless', dest='headless', action='store_false')
+
+    status = commands.add_parser('status', help='Print the progress of every job')
+    status.add_argument('queue')
+
+    requeue = commands.add_parser('requeue-expired', help='Hand out the units of expired leases again')
+    requeue.add_argument('queue')
+    args = parser.parse_args(argv)
+
+    SL.add_console_handler(logging.INFO, sys.stdout)
+
+    work_queue = open_work_queue(args.queue, args.lease_seconds, args.max_attempts)
+    try:
+        if args.command == 'enqueue':
+            job_ids = [work_queue.enqueue(spec) for spec in SB.expand_job_specs(SB.load_job_specs(args.job_file), args.output_dir)]
+            print(f'Enqueued jobs {job_ids}')
+        elif args.command == 'worker':
+            units_done = QueueWorker(work_queue,
+                                     worker_id=args.worker_id,
+                                     headless=args.headless,
+                                     browser_profile=args.browser_profile,
+                                     max_concurrent_fetches=args.max_concurrent_fetches,
+                                     sink_format=args.sink_format,
+                                     exit_when_finished=not args.keep_running).run()
+            print(f'{units_done} units done')
+        elif args.command == 'status':
+            json.dump(work_queue.status(), sys.stdout, indent=2)
+            print()
+        else:
+            print(f'{work_queue.requeue_expired()} units requeued')
+    finally:
+        work_queue.close()
+
+
+if __name__ == '__main__':
+    main()